@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+'''\
+Check that concurrent writers don't lose each other's changes.
+
+Runs many copies of taskmaster.py at once against the same file, each adding tasks and completing some of them, while
+other writers append lines directly without taking the lock, as a sync script or editor might.  Then checks that
+every task added is in the file exactly once and that every task completed is marked as completed, exiting with an
+error if not.
+'''
+
+import sys
+import os
+import re
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import generate
+
+
+TASKMASTER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'taskmaster.py')
+
+COUNTERS = ('conflict retries', 'lock waits')
+
+
+def run_writer(writer, args, env, results):
+    # Add tasks one at a time, completing every other one just after it's added
+    counts = dict((name, 0) for name in COUNTERS)
+    failures = []
+    completed = []
+    for i in range(args.tasks):
+        key = '{}-{}'.format(writer, i)
+        commands = [['add', 'stress task {} +stress stress:{}'.format(i, key)]]
+        if i % 2:
+            commands.append(['complete', '--no-archive', '--filter', 'tag:stress=' + key])
+            completed.append(key)
+        for command in commands:
+            process = subprocess.Popen([sys.executable, TASKMASTER, '--timings'] + command, env=env, stdout=open(os.devnull, 'w'), stderr=subprocess.PIPE)
+            err = process.communicate()[1]
+            if process.returncode:
+                failures.append((command, err.strip()))
+            for name in COUNTERS:
+                match = re.search(r'^{}\s+(\d+)$'.format(name), err, re.M)
+                if match:
+                    counts[name] += int(match.group(1))
+    results[writer] = (counts, failures, completed)
+
+
+def run_unlocked_writer(writer, args, filename, results):
+    # Appends lines straight to the file, so only the conflict check protects against it
+    lines = []
+    for i in range(args.tasks):
+        line = 'unlocked task {} stress:u{}-{}'.format(i, writer, i)
+        with open(filename, 'a') as fp:
+            fp.write(line + '\n')
+        lines.append(line)
+        time.sleep(args.unlocked_delay)
+    results[writer] = lines
+
+
+def check_file(filename, args, results, unlocked_results):
+    warnings.simplefilter('ignore')
+    import taskmaster
+
+    todotxt = taskmaster.TMTodoTxt(filename, use_cache=False)
+    found = {}
+    for task in todotxt.tasks:
+        key = task.tags.get('stress')
+        if key:
+            found.setdefault(key, []).append(task)
+
+    problems = []
+    for writer, (counts, failures, completed) in results.items():
+        for command, error in failures:
+            problems.append('writer {}: {} failed: {}'.format(writer, ' '.join(command), error))
+        for i in range(args.tasks):
+            key = '{}-{}'.format(writer, i)
+            if len(found.get(key, ())) != 1:
+                problems.append('task {} found {} times'.format(key, len(found.get(key, ()))))
+        for key in completed:
+            if found.get(key) and not found[key][0].completed:
+                problems.append('task {} was not completed'.format(key))
+    for writer, lines in unlocked_results.items():
+        for i in range(len(lines)):
+            key = 'u{}-{}'.format(writer, i)
+            if len(found.get(key, ())) != 1:
+                problems.append('unlocked task {} found {} times'.format(key, len(found.get(key, ()))))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that concurrent writers don't lose each other's changes")
+    parser.add_argument('-w', '--writers', type=int, default=8, help="Number of taskmaster.py processes running at once")
+    parser.add_argument('-u', '--unlocked-writers', type=int, default=1, help="Number of writers appending to the file without the lock")
+    parser.add_argument('-t', '--tasks', type=int, default=20, help="Tasks added by each writer")
+    parser.add_argument('-n', '--lines', type=int, default=1000, help="Number of tasks in the file to start with")
+    parser.add_argument('--unlocked-delay', type=float, default=0.05, help="Seconds between lines from the unlocked writers")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='taskmaster-concurrency-')
+    try:
+        filename = os.path.join(workdir, 'todo.txt')
+        with open(filename, 'w') as fp:
+            for line in generate.generate_lines(args.lines, rrule=0):
+                fp.write(line + '\n')
+        # The config file is read from the home directory
+        with open(os.path.join(workdir, '.taskmasterrc'), 'w') as fp:
+            fp.write('todo.txt: {}\n'.format(filename))
+        env = dict(os.environ, HOME=workdir)
+
+        results = {}
+        unlocked_results = {}
+        threads = [threading.Thread(target=run_writer, args=(writer, args, env, results)) for writer in range(args.writers)]
+        threads += [threading.Thread(target=run_unlocked_writer, args=(writer, args, filename, unlocked_results)) for writer in range(args.unlocked_writers)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        problems = check_file(filename, args, results, unlocked_results)
+    finally:
+        shutil.rmtree(workdir)
+
+    commands = sum(args.tasks + args.tasks // 2 for writer in results)
+    print '{} commands from {} writers in {:.1f}s, {} lines from {} unlocked writers'.format(commands, args.writers, elapsed, args.tasks * args.unlocked_writers, args.unlocked_writers)
+    for name in COUNTERS:
+        print '{:<24} {:>6}'.format(name, sum(counts[name] for counts, failures, completed in results.values()))
+    for problem in problems:
+        print problem
+    print 'FAILED' if problems else 'ok'
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
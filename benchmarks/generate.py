@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+'''\
+Generate a synthetic todo.txt file.
+
+The tasks are random but repeatable for a given seed, with a configurable share of completed tasks, tasks with due
+dates, recurring tasks, and tasks with projects and contexts, and subtasks nested up to a given depth.
+'''
+
+import sys
+import random
+import argparse
+
+
+WORDS = (
+    'buy', 'call', 'email', 'fix', 'write', 'review', 'plan', 'clean', 'book', 'pay', 'order', 'update', 'check',
+    'milk', 'report', 'car', 'garden', 'taxes', 'flights', 'invoice', 'kitchen', 'notes', 'slides', 'budget', 'mom',
+    'the', 'for', 'with', 'about', 'before', 'after', 'new', 'old', 'weekly', 'draft', 'final',
+)
+PROJECTS = ['project{}'.format(i) for i in range(50)]
+CONTEXTS = ['home', 'work', 'phone', 'errands', 'computer', 'office', 'garage', 'online']
+RRULES = ('RRULE:FREQ=DAILY', 'RRULE:FREQ=WEEKLY', 'RRULE:FREQ=MONTHLY;INTERVAL=2', 'RRULE:FREQ=YEARLY;COUNT=5')
+
+
+def random_date(rng):
+    return '{}-{:02d}-{:02d}'.format(rng.choice((2025, 2026, 2027)), rng.randint(1, 12), rng.randint(1, 28))
+
+
+def generate_description(rng, tagged, due):
+    words = [rng.choice(WORDS) for i in range(rng.randint(2, 8))]
+    if rng.random() < tagged:
+        words.append('+' + rng.choice(PROJECTS))
+        words.append('@' + rng.choice(CONTEXTS))
+    if rng.random() < due:
+        words.append('due:' + random_date(rng))
+    return ' '.join(words)
+
+
+def generate_subtasks(rng, depth, level=1, tagged=0, due=0):
+    out = ''
+    if level > depth:
+        return out
+    for i in range(rng.randint(0, 3) if level == 1 else rng.randint(0, 2)):
+        out += ' ' + '&&' * level + generate_description(rng, tagged, due)
+        out += generate_subtasks(rng, depth, level + 1, tagged, due)
+    return out
+
+
+def generate_lines(count, seed=0, depth=2, subtasks=0.3, completed=0.2, priority=0.3, due=0.3, rrule=0.05, tagged=0.6):
+    '''\
+    Yield count task lines, each of the ratio arguments being the share of tasks with that feature.
+    '''
+    rng = random.Random(seed)
+    for i in range(count):
+        line = ''
+        if rng.random() < completed:
+            line += 'x ' + random_date(rng) + ' '
+        if rng.random() < priority:
+            line += '(' + rng.choice('ABCDE') + ') '
+        line += random_date(rng) + ' '
+        has_rrule = rng.random() < rrule
+        line += generate_description(rng, tagged, 1 if has_rrule else due)
+        if has_rrule:
+            line += ' rrule:' + rng.choice(RRULES)
+        if depth and rng.random() < subtasks:
+            line += generate_subtasks(rng, depth, tagged=tagged, due=due)
+        yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic todo.txt file")
+    parser.add_argument('-n', '--lines', type=int, default=10000, help="Number of top level tasks")
+    parser.add_argument('-o', '--output', help="File to write, standard output if not given")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--depth', type=int, default=2, help="Maximum subtask nesting depth, 0 for no subtasks")
+    parser.add_argument('--subtasks', type=float, default=0.3, help="Share of tasks with subtasks")
+    parser.add_argument('--completed', type=float, default=0.2, help="Share of completed tasks")
+    parser.add_argument('--priority', type=float, default=0.3, help="Share of tasks with a priority")
+    parser.add_argument('--due', type=float, default=0.3, help="Share of tasks with a due date")
+    parser.add_argument('--rrule', type=float, default=0.05, help="Share of recurring tasks")
+    parser.add_argument('--tagged', type=float, default=0.6, help="Share of tasks with a project and context")
+    args = parser.parse_args()
+
+    lines = generate_lines(
+        args.lines,
+        seed=args.seed,
+        depth=args.depth,
+        subtasks=args.subtasks,
+        completed=args.completed,
+        priority=args.priority,
+        due=args.due,
+        rrule=args.rrule,
+        tagged=args.tagged,
+    )
+    fp = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for line in lines:
+            fp.write(line + '\n')
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+
+
+if __name__ == '__main__':
+    main()
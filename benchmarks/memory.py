@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+'''\
+Measure the memory used per parsed task.
+
+Parses a synthetic task list and reports the deep size of the parsed tasks (every object reachable from them,
+counting shared objects once) divided by the number of tasks and subtasks.
+
+With --baseline, the same sample is also parsed and measured with taskmaster.py as of another git revision, by
+default the one before tasks used __slots__, for comparison.
+'''
+
+import sys
+import os
+import imp
+import types
+import shutil
+import tempfile
+import argparse
+import subprocess
+import warnings
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import taskmaster
+
+
+SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def deep_size(obj, seen):
+    if id(obj) in seen or isinstance(obj, SKIP_TYPES):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, slot):
+                size += deep_size(getattr(obj, slot), seen)
+    return size
+
+
+def sample_lines(count):
+    for i in range(count):
+        line = '({}) 2026-{:02d}-{:02d} Task number {} +project{} @context{}'.format('ABC'[i % 3], i % 12 + 1, i % 28 + 1, i, i % 20, i % 5)
+        if i % 4 == 0:
+            line += ' due:2026-11-{:02d}'.format(i % 28 + 1)
+        if i % 10 == 0:
+            line += ' rrule:RRULE:FREQ=WEEKLY'
+        if i % 3 == 0:
+            line += ' &&first subtask &&&&nested subtask &&second subtask'
+        yield line
+
+
+def git(*args):
+    return subprocess.check_output(['git'] + list(args), cwd=ROOT).strip()
+
+
+def slots_parent():
+    # The revision before the one that first gave taskmaster.py __slots__
+    added = git('log', '--reverse', '--format=%H', '-S__slots__', '--', 'taskmaster.py').split()
+    if not added:
+        raise SystemExit("No revision of taskmaster.py adds __slots__, give one to compare with")
+    return added[0] + '^'
+
+
+def load_revision(revision):
+    # Import taskmaster.py as it was at revision as a module of its own
+    source = git('show', revision + ':taskmaster.py')
+    workdir = tempfile.mkdtemp(prefix='taskmaster-memory-')
+    try:
+        filename = os.path.join(workdir, 'taskmaster.py')
+        with open(filename, 'w') as fp:
+            fp.write(source + '\n')
+        return imp.load_source('taskmaster_baseline', filename)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def parse_sample(module, lines):
+    return [module.TMTask.parse(line, id=id) for id, line in enumerate(sample_lines(lines), 1)]
+
+
+def measure(tasks):
+    return deep_size(tasks, set()) - sys.getsizeof(tasks)
+
+
+def count_tasks(tasks):
+    return sum(1 + count_tasks(task.subtasks) for task in tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory used per parsed task")
+    parser.add_argument('-n', '--lines', type=int, default=10000, help="Number of top level tasks to parse")
+    parser.add_argument('--baseline', nargs='?', const='', metavar='REVISION', help="Also measure taskmaster.py as of a git revision, the one before __slots__ by default")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    tasks = parse_sample(taskmaster, args.lines)
+    count = count_tasks(tasks)
+    size = measure(tasks)
+    print '{} tasks, {} bytes, {:.0f} bytes per task'.format(count, size, float(size) / count)
+    if args.baseline is not None:
+        revision = args.baseline or slots_parent()
+        baseline_tasks = parse_sample(load_revision(revision), args.lines)
+        baseline_size = measure(baseline_tasks)
+        print '{}: {} bytes, {:.0f} bytes per task'.format(git('rev-parse', '--short', revision), baseline_size, float(baseline_size) / count_tasks(baseline_tasks))
+
+
+if __name__ == '__main__':
+    main()
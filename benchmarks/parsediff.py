@@ -0,0 +1,206 @@
+#! /usr/bin/env python
+'''\
+Check that the parser reads lines the same way the original one did.
+
+Parses a generated corpus with a copy of the original parser, which split lines with ws_re.split and split_with_ws
+and subtasks with a regular expression per depth, and with taskmaster.py's single pass parser, then compares the
+fields of every task and subtask and the line each is written back as, exiting with an error if any differ.  Lines
+the original parser failed on are counted and skipped, as there's nothing to compare them against.
+'''
+
+import sys
+import os
+import re
+import argparse
+import datetime
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import generate
+
+
+# The original parser, with dates kept as YYYY-MM-DD strings rather than Pendulum objects
+
+ws_re = re.compile(ur'\s+')
+date_re = re.compile(ur'^\d{4}-\d{2}-\d{2}')
+
+
+def split_with_ws(data):
+    out = []
+    token = ''
+    in_ws = False
+    for c in data.strip():
+        if c in (' ', '\t'):
+            in_ws = True
+        elif in_ws:
+            out.append(token)
+            token = ''
+            in_ws = False
+
+        token += c
+
+    if token:
+        out.append(token)
+
+    return out
+
+
+def parse_date(value):
+    # Raises ValueError for a date that isn't one, as pendulum.parse did
+    return datetime.datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+def baseline_parse(line, depth=0):
+    '''\
+    Return a task as a dict of its fields, with its subtasks, as the original Task.parse and TMTask.parse did.
+    '''
+    task = {
+        'completed': False,
+        'priority': None,
+        'created_at': None,
+        'completed_at': None,
+        'projects': [],
+        'contexts': [],
+        'tags': {},
+        'subtasks': [],
+    }
+
+    if line.startswith('x '):
+        task['completed'] = True
+        line = ws_re.split(line, 1)[1]
+
+    if line.startswith('('):
+        task['priority'] = 26 - (ord(line[1]) - 65)
+        line = ws_re.split(line, 1)[1]
+
+    if date_re.match(line):
+        date_1 = line[:10]
+        line = ws_re.split(line, 1)[1]
+        if date_re.match(line):
+            # 2 dates, first is completion, second is creation
+            task['completed_at'] = parse_date(date_1)
+            task['created_at'] = parse_date(line[:10])
+            line = ws_re.split(line, 1)[1]
+        else:
+            # 1 date, must be creation
+            task['created_at'] = parse_date(date_1)
+
+    # TMTask.parse_description: split off the subtasks at this depth
+    new_description = []
+    found_subtasks = False
+    candidates = re.split(ur'(\s+' + ('&&' * (depth + 1)) + '[^&])', line)
+    while candidates:
+        candidate = candidates.pop(0)
+        if candidate.strip().startswith('&&' * (depth + 1)):
+            found_subtasks = True
+            candidate = (candidate + candidates.pop(0)).strip().lstrip('&')
+            task['subtasks'].append(baseline_parse(candidate, depth=depth + 1))
+        elif not found_subtasks:
+            new_description.append(candidate)
+
+    # Task.parse_description: projects, contexts, and tags
+    new_description_words = []
+    for candidate in split_with_ws(''.join(new_description)):
+        if candidate.startswith('+') and len(candidate.strip()) > 1:
+            task['projects'].append(candidate[1:].strip())
+        elif candidate.startswith('@') and len(candidate.strip()) > 1:
+            task['contexts'].append(candidate[1:].strip())
+        elif ':' in candidate and len(candidate.strip()) > 2:
+            k, v = candidate.strip().split(':', 1)
+            task['tags'][k] = v
+        else:
+            new_description_words.append(candidate)
+    task['description'] = ''.join(new_description_words).strip()
+
+    return task
+
+
+def baseline_str(task, today, depth=0):
+    # The original Task.__str__ and TMTask._make_string, with a missing creation date written as today's
+    out = ''
+    if task['completed']:
+        out += 'x '
+    if task['priority'] is not None:
+        out += '(' + chr((26 - task['priority']) + 65) + ') '
+    if task['completed_at']:
+        out += task['completed_at'] + ' '
+    out += (task['created_at'] or today) + ' '
+    out += task['description']
+    for project in task['projects']:
+        if '+' + project not in out:
+            out += ' +' + project
+    for context in task['contexts']:
+        if '@' + context not in out:
+            out += ' @' + context
+    for k, v in task['tags'].items():
+        if k + ':' + v not in out:
+            out += ' ' + k + ':' + v
+    if depth > 0:
+        out = ' ' + ('&&' * depth) + out
+    return out + ''.join(baseline_str(subtask, today, depth + 1) for subtask in task['subtasks'])
+
+
+def baseline_fields(task):
+    return [(
+        task['completed'],
+        task['priority'],
+        task['completed_at'],
+        task['created_at'],
+        task['description'],
+        task['projects'],
+        task['contexts'],
+        sorted(task['tags'].items()),
+    )] + [baseline_fields(subtask) for subtask in task['subtasks']]
+
+
+def current_fields(taskmaster, task):
+    return [(
+        task.completed,
+        task.priority,
+        taskmaster.format_date(task.completed_at) if task.completed_at else None,
+        None if task.created_at_default else taskmaster.format_date(task.created_at),
+        task.description,
+        list(task.projects),
+        list(task.contexts),
+        sorted(task.tags.items()),
+    )] + [current_fields(taskmaster, subtask) for subtask in task.subtasks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the parser with the original one on a generated corpus")
+    parser.add_argument('-n', '--lines', type=int, default=5000, help="Number of lines to generate")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the generated lines")
+    parser.add_argument('--depth', type=int, default=3, help="Maximum subtask nesting depth")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Print every line that differs")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    import taskmaster
+
+    today = datetime.datetime.utcnow().strftime('%Y-%m-%d')
+    compared = skipped = 0
+    differences = []
+    for line in generate.generate_lines(args.lines, seed=args.seed, depth=args.depth):
+        try:
+            expected = baseline_parse(line)
+        except (IndexError, ValueError):
+            skipped += 1
+            continue
+        compared += 1
+        task = taskmaster.TMTask.parse(line, id=1)
+        if current_fields(taskmaster, task) != baseline_fields(expected):
+            differences.append(('fields', line))
+        elif str(task) != baseline_str(expected, today):
+            differences.append(('written', line))
+
+    print '{} lines compared, {} skipped as the original parser failed on them'.format(compared, skipped)
+    for kind, line in differences[:None if args.verbose else 10]:
+        print '{} differ: {}'.format(kind, line)
+    print '{} differences'.format(len(differences))
+    print 'FAILED' if differences else 'ok'
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
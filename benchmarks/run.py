@@ -0,0 +1,219 @@
+#! /usr/bin/env python
+'''\
+Time the common operations on a synthetic task list.
+
+Each operation runs in a fresh process against a fresh copy of a generated file, so the timings include reading the
+file (or the parse cache) but not interpreter start up, and the peak memory is that of the operation alone.  The
+results are printed and can be written out as JSON to compare later runs against.
+'''
+
+import sys
+import os
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import resource
+import subprocess
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import generate
+
+
+OPERATIONS = ('load', 'list', 'top', 'search', 'show', 'add', 'complete', 'next', 'save')
+
+
+def run_operation(operation, filename, task_id, use_cache):
+    '''\
+    Run one operation in this process, returning the time it took in seconds.
+    '''
+    warnings.simplefilter('ignore')
+    import taskmaster
+
+    config = taskmaster.Config()
+    config['todo.txt'] = filename
+    config['done.txt'] = os.path.join(os.path.dirname(filename), 'done.txt')
+    todotxt = taskmaster.TMTodoTxt(filename, use_cache=use_cache)
+    commands = {
+        'list': (taskmaster.ListCommand, []),
+        'top': (taskmaster.TopCommand, []),
+        'search': (taskmaster.SearchCommand, ['garden', 'invoice*']),
+        'show': (taskmaster.ShowCommand, [task_id]),
+        'add': (taskmaster.AddCommand, ['benchmark task +bench @bench due:2026-12-01']),
+        'complete': (taskmaster.CompleteCommand, [task_id]),
+        'next': (taskmaster.NextCommand, [task_id]),
+    }
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        if operation == 'load':
+            start = time.time()
+            todotxt.load()
+        elif operation == 'save':
+            # Every task is written out again rather than just appended
+            for task in todotxt.tasks:
+                task.dirty = True
+            start = time.time()
+            todotxt.save()
+        else:
+            command_class, command_args = commands[operation]
+            start = time.time()
+            command = command_class('taskmaster.py', config, todotxt)
+            status = command(command_args)
+            if status:
+                raise RuntimeError('{} failed with status {}'.format(operation, status))
+        return time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def run_worker(args):
+    elapsed = run_operation(args.worker, args.file, args.task_id, not args.no_cache)
+    # ru_maxrss is in kilobytes on Linux
+    json.dump({'seconds': elapsed, 'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}, sys.stdout)
+
+
+def pick_task_ids(filename):
+    '''\
+    Pick a task near the middle of the file to show and complete, and a recurring one for next.
+    '''
+    with open(filename, 'r') as fp:
+        lines = [line.strip() for line in fp]
+    middle = len(lines) // 2
+    order = range(middle, len(lines)) + range(0, middle)
+    pending = [i for i in order if not lines[i].startswith('x ')]
+    recurring = [i for i in pending if ' rrule:' in lines[i]]
+    return {
+        'show': str(middle + 1),
+        'complete': str(pending[0] + 1) if pending else None,
+        'next': str(recurring[0] + 1) if recurring else None,
+    }
+
+
+def run_benchmarks(args, original):
+    workdir = tempfile.mkdtemp(prefix='taskmaster-bench-')
+    filename = os.path.join(workdir, 'todo.txt')
+    task_ids = pick_task_ids(original)
+    results = {}
+    try:
+        for operation in args.operations:
+            task_id = task_ids.get(operation, '1')
+            if task_id is None:
+                print >>sys.stderr, 'Skipping {}, no suitable task in the file'.format(operation)
+                continue
+            runs = []
+            for i in range(args.repeat):
+                shutil.copyfile(original, filename)
+                for suffix in ('.cache', '.offsets', '.search'):
+                    if os.path.exists(filename + suffix):
+                        os.unlink(filename + suffix)
+                command = [sys.executable, os.path.abspath(__file__), '--worker', operation, '--file', filename, '--task-id', task_id]
+                if args.no_cache:
+                    command.append('--no-cache')
+                else:
+                    # Build the cache first so the timed run reads from it, and the search index for search
+                    subprocess.check_call(command[:3] + ['load'] + command[4:], stdout=open(os.devnull, 'w'))
+                    if operation == 'search':
+                        subprocess.check_call(command, stdout=open(os.devnull, 'w'))
+                runs.append(json.loads(subprocess.check_output(command)))
+            seconds = sorted(run['seconds'] for run in runs)
+            results[operation] = {
+                'seconds': seconds,
+                'min_seconds': seconds[0],
+                'median_seconds': seconds[len(seconds) // 2],
+                'peak_rss_kb': max(run['peak_rss_kb'] for run in runs),
+            }
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+def print_results(results, baseline=None):
+    for operation in OPERATIONS:
+        if operation not in results:
+            continue
+        result = results[operation]
+        line = '{:<10} {:>10.4f}s median {:>10.4f}s min {:>10} KB peak'.format(operation, result['median_seconds'], result['min_seconds'], result['peak_rss_kb'])
+        if baseline and operation in baseline:
+            line += '  {:>+7.1%} time {:>+7.1%} memory'.format(
+                result['median_seconds'] / baseline[operation]['median_seconds'] - 1,
+                float(result['peak_rss_kb']) / baseline[operation]['peak_rss_kb'] - 1,
+            )
+        print line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time common operations on a synthetic task list")
+    parser.add_argument('-n', '--lines', type=int, default=10000, help="Number of top level tasks to generate")
+    parser.add_argument('-f', '--file', help="Use this todo.txt instead of generating one (it's copied, not changed)")
+    parser.add_argument('-r', '--repeat', type=int, default=5, help="Times to run each operation")
+    parser.add_argument('-o', '--output', help="Write the results to this file as JSON")
+    parser.add_argument('-c', '--compare', help="Compare against results previously written with --output")
+    parser.add_argument('--no-cache', action='store_true', help="Parse the file every time rather than reading the cache")
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS), help="Operations to time")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the generated file")
+    parser.add_argument('--depth', type=int, default=2, help="Maximum subtask nesting depth")
+    parser.add_argument('--completed', type=float, default=0.2, help="Share of completed tasks")
+    parser.add_argument('--due', type=float, default=0.3, help="Share of tasks with a due date")
+    parser.add_argument('--rrule', type=float, default=0.05, help="Share of recurring tasks")
+    parser.add_argument('--tagged', type=float, default=0.6, help="Share of tasks with a project and context")
+    parser.add_argument('--worker', choices=OPERATIONS, help=argparse.SUPPRESS)
+    parser.add_argument('--task-id', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    generated = None
+    if args.file:
+        original = args.file
+        params = {'file': os.path.abspath(args.file)}
+    else:
+        params = dict((k, getattr(args, k)) for k in ('lines', 'seed', 'depth', 'completed', 'due', 'rrule', 'tagged'))
+        fd, generated = tempfile.mkstemp(prefix='taskmaster-bench-', suffix='.txt')
+        with os.fdopen(fd, 'w') as fp:
+            for line in generate.generate_lines(
+                args.lines,
+                seed=args.seed,
+                depth=args.depth,
+                completed=args.completed,
+                due=args.due,
+                rrule=args.rrule,
+                tagged=args.tagged,
+            ):
+                fp.write(line + '\n')
+        original = generated
+
+    try:
+        results = run_benchmarks(args, original)
+    finally:
+        if generated:
+            os.unlink(generated)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as fp:
+            baseline = json.load(fp)['results']
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'params': params,
+                'repeat': args.repeat,
+                'cache': not args.no_cache,
+                'results': results,
+            }, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+'''\
+Check that start-up stays quick.
+
+Runs taskmaster.py with a few arguments that shouldn't need any dates, each in a fresh interpreter, and fails if the
+median time is over a limit or if any of the slow to import libraries were imported along the way.  Commands that
+read tasks are run against a file of tasks without any dates.
+'''
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+
+TASKMASTER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'taskmaster.py')
+
+# Only needed once dates, recurrences or the daemon are actually used
+DEFERRED_MODULES = ('pendulum', 'dateutil', 'dateutil.rrule', 'SocketServer', 'multiprocessing')
+
+CHECKS = (
+    ['--help'],
+    ['list', '--help'],
+    ['complete', '--help'],
+    ['show', '1'],
+)
+
+# The file the checks run against, in a home directory of their own
+DATELESS_TASKS = '''\
+plain task
+(A) another task +project @context
+'''
+
+# Runs taskmaster.py the way the command line does, so it's compiled every time rather than loaded from a .pyc
+CHILD = '''\
+import sys, os, time, json, runpy
+start = time.time()
+sys.argv = [{filename!r}] + {args!r}
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+try:
+    runpy.run_path({filename!r}, run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = stdout
+json.dump({{'seconds': time.time() - start, 'modules': [m for m in {modules!r} if sys.modules.get(m)]}}, sys.stdout)
+'''
+
+
+def run_check(args, env):
+    code = CHILD.format(filename=TASKMASTER, args=args, modules=DEFERRED_MODULES)
+    return json.loads(subprocess.check_output([sys.executable, '-c', code], env=env))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that taskmaster.py starts quickly")
+    parser.add_argument('-r', '--repeat', type=int, default=10, help="Times to run each check")
+    parser.add_argument('--max-ms', type=float, default=100, help="Fail if the median time of a check is over this many milliseconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='taskmaster-startup-')
+    try:
+        filename = os.path.join(workdir, 'todo.txt')
+        with open(filename, 'w') as fp:
+            fp.write(DATELESS_TASKS)
+        # The config file is read from the home directory
+        with open(os.path.join(workdir, '.taskmasterrc'), 'w') as fp:
+            fp.write('todo.txt: {}\n'.format(filename))
+        env = dict(os.environ, HOME=workdir)
+
+        failed = False
+        for check in CHECKS:
+            runs = [run_check(check, env) for i in range(args.repeat)]
+            median = sorted(run['seconds'] for run in runs)[len(runs) // 2] * 1000
+            imported = sorted(set(module for run in runs for module in run['modules']))
+            problems = []
+            if median > args.max_ms:
+                problems.append('over {:.0f}ms'.format(args.max_ms))
+            if imported:
+                problems.append('imported ' + ', '.join(imported))
+            failed = failed or bool(problems)
+            print '{:<24} {:>7.1f}ms  {}'.format(' '.join(check), median, '; '.join(problems) or 'ok')
+    finally:
+        shutil.rmtree(workdir)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,16 +3,114 @@
 import sys
 import os
 import re
+import signal
 import argparse
 import textwrap
 import copy
+import datetime
+import time
+import hashlib
+import marshal
+import stat
+import errno
+import fcntl
+import mmap
+import array
+import bisect
+import heapq
+import operator
+import itertools
+import traceback
+import contextlib
+import functools
 from collections import OrderedDict
+from StringIO import StringIO
 
-import pendulum
-from dateutil import rrule
 
+class _LazyModule(object):
+    '''\
+    A module that's imported the first time one of its attributes is used.
+
+    The date and recurrence libraries take longer to import than everything else put together, and many runs never
+    touch a date.
+    '''
+
+    def __init__(self, name, on_import=None):
+        self._name = name
+        self._on_import = on_import
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            start = time.time()
+            __import__(self._name)
+            module = sys.modules[self._name]
+            if self._on_import:
+                self._on_import(module)
+            self._module = module
+            timings.add('import ' + self._name, time.time() - start)
+        return getattr(self._module, attr)
+
+
+pendulum = _LazyModule('pendulum', lambda module: module.set_formatter('alternative'))
+rrule = _LazyModule('dateutil.rrule')
+
+
+class Timings(object):
+    '''\
+    Phase timings and counters, printed with --timings.
+
+    There are only a handful of phases per run so they are always timed, counters are only kept when enabled.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = OrderedDict()
+        self.counts = OrderedDict()
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.add(name, time.time() - start)
 
-pendulum.set_formatter('alternative')
+    def add(self, name, seconds):
+        depth, total, calls = self.phases.get(name, (self._depth, 0.0, 0))
+        self.phases[name] = (depth, total + seconds, calls + 1)
+
+    def timed(self, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapped(*args, **kwargs):
+                with self.phase(name):
+                    return fn(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def counted(self, name, iterable):
+        # Count the items of an iterable as they're consumed
+        for item in iterable:
+            self.count(name)
+            yield item
+
+    def report(self, fp):
+        # Phases are listed in the order they finished, nested ones are indented under the phase containing them
+        for name, (depth, seconds, calls) in self.phases.items():
+            fp.write('{:<24} {:>9.4f}s{}\n'.format('  ' * depth + name, seconds, ' ({} calls)'.format(calls) if calls > 1 else ''))
+        for name, value in self.counts.items():
+            fp.write('{:<24} {:>10}\n'.format(name, value))
+
+
+timings = Timings()
 
 
 def iso8601dt(dt):
@@ -21,40 +119,111 @@ def iso8601dt(dt):
     return dt.in_timezone('UTC').format('YYYY-MM-DD[T]HH:mm:ss[Z]')
 
 
+DATE_CACHE_SIZE = 4096
+date_only_re = re.compile(ur'^(\d{4})-(\d{2})-(\d{2})$')
+_parse_date_cache = {}
+_format_date_cache = {}
+
+
+def _cache_date(cache, key, value):
+    # Bounded by simply starting over, the same few hundred dates tend to repeat throughout a file
+    if len(cache) >= DATE_CACHE_SIZE:
+        cache.clear()
+    cache[key] = value
+    return value
+
+
 def parse_date(dt):
-    if not isinstance(dt, pendulum.pendulum.Pendulum):
+    if isinstance(dt, basestring):
+        try:
+            return _parse_date_cache[dt]
+        except KeyError:
+            pass
+        match = date_only_re.match(dt)
+        if match:
+            # Pendulum instances are immutable, so the same instance can be shared by every task
+            year, month, day = map(int, match.groups())
+            return _cache_date(_parse_date_cache, dt, pendulum.Pendulum(year, month, day, tzinfo=pendulum.UTC))
+        dt = pendulum.parse(dt)
+    elif not isinstance(dt, pendulum.pendulum.Pendulum):
         dt = pendulum.parse(dt)
     return dt.in_timezone('UTC').hour_(0).minute_(0).second_(0).microsecond_(0)
 
 
 def format_date(dt):
-    return dt.format('YYYY-MM-DD')
+    # Keyed on the date in dt's own timezone, as the same instant in different timezones compares equal
+    key = (dt.year, dt.month, dt.day)
+    try:
+        return _format_date_cache[key]
+    except KeyError:
+        return _cache_date(_format_date_cache, key, dt.format('YYYY-MM-DD'))
+
 
+_utcnow_cache = [None, None]
 
-def split_with_ws(data):
-    out = []
-    token = ''
-    in_ws = False
-    for c in data.strip():
-        if c in (' ', '\t'):
-            in_ws = True
-        elif in_ws:
-            out.append(token)
-            token = ''
-            in_ws = False
 
-        token += c
+def utcnow():
+    '''\
+    The current time, shared by every call within the same second.
+    '''
+    second = int(time.time())
+    if _utcnow_cache[0] != second:
+        _utcnow_cache[:] = [second, pendulum.utcnow()]
+    return _utcnow_cache[1]
+
+
+def utctoday():
+    '''\
+    Today's date in UTC as YYYY-MM-DD, as format_date(utcnow()) would give without needing pendulum.
+    '''
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+
+def intern_str(value):
+    # Only byte strings can be interned
+    return intern(value) if type(value) is str else value
+
+
+class _EmptyDict(dict):
+    '''\
+    A read-only empty dict, shared by every task without tags.
+    '''
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("The shared empty dict is read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
 
-    if token:
-        out.append(token)
 
-    return out
+# Tasks without projects, contexts, tags, or subtasks share these empty containers.  They are read-only, the task's
+# container is replaced with a new one when something is added.
+EMPTY_LIST = ()
+EMPTY_SET = frozenset()
+EMPTY_DICT = _EmptyDict()
+
+
+token_re = re.compile(ur'(\S+)(\s*)')
+
+
+def tokenize(data):
+    '''\
+    Split data into (word, trailing whitespace) pairs in a single pass.
+    '''
+    return token_re.findall(data)
 
 
 class Config(dict):
     def __init__(self):
         config = {
             'todo.txt': '~/todo.txt',
+            'socket': '~/.taskmaster.sock',
+            'done.txt': None,
+            'archive-on-complete': None,
+            'parallel-threshold': None,
+            'parallel-workers': None,
+            'lock-timeout': None,
         }
         filename = os.path.abspath(os.path.normpath(os.path.expanduser('~/.taskmasterrc')))
         if os.path.exists(filename):
@@ -65,11 +234,21 @@ class Config(dict):
                     if line:
                         match = kv_re.match(line)
                         if match:
-                            config[match.group(0)] = match.group(1) or None
+                            config[match.group(1)] = match.group(2) or None
+        if not config['done.txt']:
+            config['done.txt'] = os.path.join(os.path.dirname(config['todo.txt']), 'done.txt')
         super(Config, self).__init__(**config)
 
+    def get_bool(self, key):
+        return (self.get(key) or '').lower() in ('1', 'yes', 'true', 'on')
+
+    def get_int(self, key):
+        value = self.get(key)
+        return int(value) if value else None
+
 
 class TaskListMixin(object):
+    __slots__ = ()
     TASK_LIST_ATTR = 'tasks'
 
     @property
@@ -78,129 +257,258 @@ class TaskListMixin(object):
             setattr(self, self.TASK_LIST_ATTR, [])
         return getattr(self, self.TASK_LIST_ATTR)
 
+    def _next_task_id(self):
+        # IDs only increase along a list, so the last task has the highest one
+        tasklist = self._tasklist
+        return tasklist[-1].id + 1 if tasklist else 1
+
     def append(self, task):
-        if self._tasklist:
-            new_id = max([t.id or 0 for t in self._tasklist]) + 1
-        else:
-            new_id = 1
-        task.id = new_id
-        self._tasklist.append(task)
+        task.id = self._next_task_id()
+        tasklist = self._tasklist
+        if tasklist is EMPTY_LIST:
+            tasklist = []
+            setattr(self, self.TASK_LIST_ATTR, tasklist)
+        tasklist.append(task)
+
+    def remove(self, task):
+        # The remaining tasks keep their IDs
+        tasklist = self._tasklist
+        if not isinstance(tasklist, list):
+            tasklist = list(tasklist)
+            setattr(self, self.TASK_LIST_ATTR, tasklist)
+        tasklist.remove(task)
 
     def print_tasks(self):
         for task in self._tasklist:
             print task.id, str(task)
 
+    def get_child(self, id):
+        tasklist = self._tasklist
+        # A task is at the position matching its ID unless tasks before it were removed
+        if 0 < id <= len(tasklist) and tasklist[id - 1].id == id:
+            return tasklist[id - 1]
+        # Otherwise it's earlier in the list, which is still ordered by ID
+        lo, hi = 0, min(id, len(tasklist))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tasklist[mid].id < id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(tasklist) and tasklist[lo].id == id:
+            return tasklist[lo]
+        return None
+
     def get(self, id):
         try:
-            ids = map(lambda v: int(v) - 1, str(id).split('.'))
-            task = self._tasklist[ids.pop(0)]
-            while ids:
-                task = task._tasklist[ids.pop(0)]
-            return task
-        except IndexError:
+            ids = [int(v) for v in str(id).split('.')]
+        except ValueError:
             return None
+        task = self
+        for child_id in ids:
+            task = task.get_child(child_id)
+            if task is None:
+                return None
+        return task
 
 
 class Task(object):
-    ws_re = re.compile(ur'\s+')
+    __slots__ = ('description', 'completed', 'priority', '_created_at', 'created_at_default', 'completed_at', 'projects', 'contexts', 'tags', 'id', 'dirty', 'line', '_rendered')
     date_re = re.compile(ur'^\d{4}-\d{2}-\d{2}')
+    priority_re = re.compile(ur'^\([A-Z]\)$')
+    # Setting any of these marks the task as changed since it was loaded
+    TRACKED_FIELDS = frozenset(['description', 'completed', 'priority', 'created_at', 'completed_at', 'projects', 'contexts', 'tags'])
 
     def __init__(self, description, completed=False, priority=None, created_at=None, completed_at=None, projects=None, contexts=None, tags=None, id=None, parse_description=False):
-        self.description = description
-        self.completed = completed
-        self.priority = priority
-        self.created_at = created_at or pendulum.utcnow()
-        self.completed_at = completed_at
-        self.projects = projects or []
-        self.contexts = contexts or []
-        self.tags = tags or {}
-        self.id = id
+        # Fields are set directly rather than through __setattr__ since a new task is dirty anyway
+        if timings.enabled:
+            timings.count('tasks created')
+        set_field = object.__setattr__
+        # New tasks are dirty until they have been written out
+        set_field(self, 'dirty', True)
+        # The line the task was read from, if it's a top level task in a file
+        set_field(self, 'line', None)
+        # What __str__ last returned, until a field changes
+        set_field(self, '_rendered', None)
+        set_field(self, 'description', description)
+        set_field(self, 'completed', completed)
+        set_field(self, 'priority', priority)
+        # Remember whether the creation date came from the task itself, so the
+        # parse cache can default it the same way a fresh parse would
+        set_field(self, 'created_at_default', created_at is None)
+        # A default creation date is only made when it's used, as it needs pendulum
+        set_field(self, '_created_at', created_at)
+        set_field(self, 'completed_at', completed_at)
+        set_field(self, 'projects', projects or EMPTY_LIST)
+        set_field(self, 'contexts', contexts or EMPTY_LIST)
+        set_field(self, 'tags', tags or EMPTY_DICT)
+        set_field(self, 'id', id)
 
         if parse_description:
             self.parse_description()
 
-    def parse_description(self):
-        new_description = []
+    @property
+    def created_at(self):
+        if self._created_at is None:
+            object.__setattr__(self, '_created_at', utcnow())
+        return self._created_at
 
-        for candidate in split_with_ws(self.description):
-            if candidate.startswith('+') and len(candidate.strip()) > 1:
-                self.projects.append(candidate[1:].strip())
-            elif candidate.startswith('@') and len(candidate.strip()) > 1:
-                self.contexts.append(candidate[1:].strip())
-            elif ':' in candidate and len(candidate.strip()) > 2:
-                k, v = candidate.strip().split(':', 1)
-                self.tags[k] = v
+    @created_at.setter
+    def created_at(self, value):
+        object.__setattr__(self, '_created_at', value)
+
+    def format_created_at(self):
+        # Today's date is written for a default creation date without making one
+        if self._created_at is None:
+            return utctoday()
+        return format_date(self._created_at)
+
+    def __setattr__(self, name, value):
+        if name in self.TRACKED_FIELDS:
+            object.__setattr__(self, 'dirty', True)
+            object.__setattr__(self, '_rendered', None)
+        object.__setattr__(self, name, value)
+
+    def is_dirty(self):
+        return self.dirty
+
+    def mark_clean(self):
+        self.dirty = False
+
+    def parse_description(self, tokens=None):
+        if tokens is None:
+            tokens = tokenize(self.description)
+
+        new_description = []
+        projects = list(self.projects)
+        contexts = list(self.contexts)
+        tags = dict(self.tags)
+        for word, ws in tokens:
+            if word[0] == '+' and len(word) > 1:
+                projects.append(intern_str(word[1:]))
+            elif word[0] == '@' and len(word) > 1:
+                contexts.append(intern_str(word[1:]))
+            elif ':' in word and len(word) > 2:
+                k, v = word.split(':', 1)
+                tags[intern_str(k)] = v
             else:
-                new_description.append(candidate)
+                new_description.append(word + ws)
 
-        self.description = ''.join(new_description).strip()
+        set_field = object.__setattr__
+        set_field(self, 'description', ''.join(new_description).strip())
+        set_field(self, 'projects', projects or EMPTY_LIST)
+        set_field(self, 'contexts', contexts or EMPTY_LIST)
+        set_field(self, 'tags', tags or EMPTY_DICT)
+        set_field(self, 'dirty', True)
+        set_field(self, '_rendered', None)
 
     @classmethod
-    def parse(self, line, **kwargs):
+    def parse_prefix(self, tokens):
+        '''\
+        Parse the completion marker, priority, and dates from the start of a task.
+
+        Returns the parsed arguments and the index of the first description token.
+        '''
         args = {
-            'description': None,
             'completed': False,
             'priority': None,
             'created_at': None,
             'completed_at': None,
-            'projects': [],
-            'contexts': [],
-            'tags': {},
         }
+        i = 0
+        count = len(tokens)
 
-        if line.startswith('x '):
+        if i < count and tokens[i][0] == 'x' and tokens[i][1][:1] == ' ':
             args['completed'] = True
-            # TODO: abstract this
-            line = self.ws_re.split(line, 1)[1]
-
-        if line.startswith('('):
-            args['priority'] = 26 - (ord(line[1]) - 65)
-            # TODO: abstract this
-            line = self.ws_re.split(line, 1)[1]
-
-        if self.date_re.match(line):
-            date_1 = line[:10]
-            # TODO: abstract this
-            line = self.ws_re.split(line, 1)[1]
-            if self.date_re.match(line):
+            i += 1
+
+        if i < count and self.priority_re.match(tokens[i][0]):
+            args['priority'] = 26 - (ord(tokens[i][0][1]) - 65)
+            i += 1
+
+        if i < count and self.date_re.match(tokens[i][0]):
+            date_1 = tokens[i][0][:10]
+            i += 1
+            if i < count and self.date_re.match(tokens[i][0]):
                 # 2 dates, first is completion, second is creation
                 args['completed_at'] = parse_date(date_1)
-                args['created_at'] = parse_date(line[:10])
-                # TODO: abstract this
-                line = self.ws_re.split(line, 1)[1]
+                args['created_at'] = parse_date(tokens[i][0][:10])
+                i += 1
             else:
                 # 1 date, must be creation
                 args['created_at'] = parse_date(date_1)
 
-        # The rest is description but may include tags
-        args['description'] = line
-        args.update(kwargs)
+        return args, i
 
-        return self(parse_description=True, **args)
+    @classmethod
+    def parse(self, line, **kwargs):
+        tokens = tokenize(line)
+        args, start = self.parse_prefix(tokens)
+        args.update(kwargs)
+        task = self('', **args)
+        # The rest is description but may include tags
+        task.parse_description(tokens[start:])
+        return task
 
     def __str__(self):
-        out = ''
+        if self._rendered is not None:
+            return self._rendered
+        out = []
         if self.completed:
-            out += 'x '
+            out.append('x ')
         if self.priority is not None:
-            out += '('  + chr((26 - self.priority) + 65) + ') '
+            out.append('(' + chr((26 - self.priority) + 65) + ') ')
         if self.completed_at:
-            out += format_date(self.completed_at) + ' '
-        if self.created_at:
-            out += format_date(self.created_at) + ' '
-        out += self.description
-        for project in self.projects:
-            if '+' + project not in out:
-                out += ' +' + project
-        for context in self.contexts:
-            if '@' + context not in out:
-                out += ' @' + context
-        for k, v in self.tags.items():
-            if k + ':' + v not in out:
-                out += ' ' + k + ':' + v
-
+            out.append(format_date(self.completed_at) + ' ')
+        out.append(self.format_created_at() + ' ')
+        description = self.format_description()
+        out.append(description)
+
+        # Projects, contexts, and tags already written out, in the description or earlier in the list, are skipped
+        seen = set(description.split())
+        for word in itertools.chain(
+            ('+' + project for project in self.projects),
+            ('@' + context for context in self.contexts),
+            (k + ':' + v for k, v in self.tags.items()),
+        ):
+            if word not in seen:
+                seen.add(word)
+                out.append(' ' + word)
+
+        out = ''.join(out)
+        object.__setattr__(self, '_rendered', out)
         return out
 
+    def format_description(self):
+        return self.description
+
+    def to_record(self):
+        return (
+            self.description,
+            self.completed,
+            self.priority,
+            None if self.created_at_default else format_date(self.created_at),
+            format_date(self.completed_at) if self.completed_at else None,
+            list(self.projects),
+            list(self.contexts),
+            dict(self.tags),
+        )
+
+    @classmethod
+    def from_record(self, record, **kwargs):
+        description, completed, priority, created_at, completed_at, projects, contexts, tags = record
+        return self(
+            description,
+            completed=completed,
+            priority=priority,
+            created_at=parse_date(created_at) if created_at else None,
+            completed_at=parse_date(completed_at) if completed_at else None,
+            projects=projects,
+            contexts=contexts,
+            tags=tags,
+            **kwargs
+        )
+
     def clone(self):
         return self.__class__(
             self.description,
@@ -208,56 +516,988 @@ class Task(object):
             priority=self.priority,
             created_at=self.created_at,
             completed_at=self.completed_at,
-            projects=self.projects,
-            contexts=self.contexts,
-            tags=self.tags,
+            projects=list(self.projects),
+            contexts=list(self.contexts),
+            tags=dict(self.tags),
         )
 
 
+class LockError(Exception):
+    pass
+
+
+class ConflictError(Exception):
+    pass
+
+
 class TodoTxt(TaskListMixin):
     TASK_CLASS = Task
+    CACHE_VERSION = 4
+
+    # Files with at least this many tasks are parsed in parallel by load(), if there's more than one CPU
+    PARALLEL_THRESHOLD = 50000
 
-    def __init__(self, filename):
+    # Seconds to wait for another process to finish with the file
+    LOCK_TIMEOUT = 30
+
+    OFFSETS_VERSION = 1
+
+    def __init__(self, filename, use_cache=True, parallel_threshold=None, workers=None, lock_timeout=None):
         self.filename = os.path.abspath(os.path.normpath(os.path.expanduser(filename)))
-        self.tasks = []
+        self.cache_filename = self.filename + '.cache'
+        self.lock_filename = self.filename + '.lock'
+        self.offsets_filename = self.filename + '.offsets'
+        self.use_cache = use_cache
+        self.parallel_threshold = self.PARALLEL_THRESHOLD if parallel_threshold is None else parallel_threshold
+        self.workers = workers
+        self.lock_timeout = self.LOCK_TIMEOUT if lock_timeout is None else lock_timeout
+        self._tasks = None
+        self._lock_fp = None
+        self._lock_depth = 0
+        # What the file looked like when it was loaded, to decide whether new tasks can simply be appended, and
+        # whether something else has changed it since
+        self._loaded_signature = None
+        self._loaded_hash = None
+        self._loaded_at = 0
+        self._loaded_count = 0
+        self._ends_with_newline = False
+        # The ending of the file's last line, for lines appended to it
+        self._newline = '\n'
+        # Top level IDs are line numbers, blank lines included, so they stay the same when tasks are removed
+        self._line_count = 0
+        self._next_id = 1
+        self._id_index = None
+        self._removed = False
+        # Top level tasks read on their own by find() through the line offsets, while the list isn't loaded
+        self._reset_partial()
+
+    def _reset_partial(self):
+        # Tasks by ID, with the exact text of each one's line, new tasks to add, and the file's signature and line
+        # offsets when they were read
+        self._partial = None
+        self._partial_lines = {}
+        self._partial_appended = []
+        self._partial_signature = None
+        self._offsets = None
 
-        self.load()
+    @property
+    def tasks(self):
+        # The file is only read and parsed the first time the tasks are needed
+        if self._tasks is None:
+            partial = (self._partial, self._partial_lines, self._partial_appended, self._partial_signature)
+            self.load()
+            if partial[0] is not None:
+                self._merge_partial(*partial)
+        return self._tasks
+
+    @tasks.setter
+    def tasks(self, value):
+        self._tasks = value
+        self._id_index = None
+        if value is None:
+            self._reset_partial()
+
+    def _file_signature(self):
+        try:
+            file_stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (file_stat.st_mtime, file_stat.st_size)
+
+    def _file_digest(self):
+        digest = hashlib.sha1()
+        with open(self.filename, 'r') as fp:
+            for chunk in iter(lambda: fp.read(65536), ''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _cache_key(self, signature, digest):
+        return (self.CACHE_VERSION, sys.hexversion) + signature + (digest,)
+
+    @contextlib.contextmanager
+    def locked(self):
+        '''\
+        Hold an exclusive lock on the file, waiting up to lock_timeout seconds for it.
+
+        The lock is advisory, and taken on a separate lock file since saving replaces the file itself.  Readers don't
+        need it, as the file is always replaced whole.  It may be taken again while already held.
+        '''
+        if self._lock_depth == 0:
+            fp = open(self.lock_filename, 'a')
+            deadline = time.time() + self.lock_timeout
+            waited = False
+            while True:
+                try:
+                    fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except IOError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        fp.close()
+                        raise LockError("Can't lock {}: {}".format(self.filename, e))
+                    if time.time() >= deadline:
+                        fp.close()
+                        raise LockError("Timed out waiting for another process to finish with " + self.filename)
+                    if not waited:
+                        timings.count('lock waits')
+                        waited = True
+                    time.sleep(0.01)
+            self._lock_fp = fp
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                # Closing the file releases the lock
+                self._lock_fp.close()
+                self._lock_fp = None
+
+    def changed_on_disk(self):
+        '''\
+        Whether something else has changed the file since it was loaded or last saved.
+
+        The size and modification time usually tell, but the contents are compared as well if they differ only by a
+        touch, or if the file was changed too soon after it was read for the modification time to show it.
+        '''
+        signature = self._file_signature()
+        if signature is None or self._loaded_signature is None:
+            return signature != self._loaded_signature
+        if signature == self._loaded_signature and signature[0] < self._loaded_at - 1:
+            return False
+        checked_at = time.time()
+        try:
+            unchanged = self._file_digest() == self._loaded_hash.hexdigest()
+        except (IOError, OSError):
+            return True
+        if unchanged:
+            # Any later change will show in the modification time, so the contents needn't be read again next time
+            self._loaded_signature = signature
+            self._loaded_at = checked_at
+        return not unchanged
+
+    def check_unchanged(self):
+        # Tasks that haven't been loaded yet will be loaded from the file as it is now
+        if self._tasks is not None:
+            changed = self.changed_on_disk()
+        else:
+            changed = self._partial is not None and self._file_signature() != self._partial_signature
+        if changed:
+            raise ConflictError(self.filename + " was changed by another program")
 
+    @classmethod
+    def _numbered_lines(self, lines):
+        # Blank lines are skipped but still counted, the line number is the task's ID
+        for id, line in enumerate(lines, 1):
+            line = line.strip()
+            if line:
+                yield id, line
+
+    def _reset(self):
+        self._reset_partial()
+        self.tasks = []
+        self._loaded_signature = None
+        self._loaded_count = 0
+        self._ends_with_newline = False
+        self._newline = '\n'
+        self._line_count = 0
+        self._next_id = 1
+        self._id_index = None
+        self._removed = False
+        self._loaded_hash = None
+        self._loaded_at = time.time()
+
+    def _read_lines(self):
+        # Read the file, noting what it looked like for save(), and return its (ID, line) pairs
+        with open(self.filename, 'r') as fp:
+            data = fp.read()
+        self._loaded_signature = self._file_signature()
+        self._loaded_hash = hashlib.sha1(data)
+        self._ends_with_newline = data.endswith('\n')
+        self._newline = '\r\n' if data.endswith('\r\n') else '\n'
+        physical_lines = data.split('\n')
+        if not physical_lines[-1]:
+            physical_lines.pop()
+        self._line_count = len(physical_lines)
+        self._next_id = self._line_count + 1
+        return list(self._numbered_lines(physical_lines))
+
+    @timings.timed('load')
     def load(self):
+        self._reset()
         if os.path.exists(self.filename):
-            with open(self.filename, 'r') as fp:
-                id = 1
-                for line in fp:
-                    line = line.strip()
-                    if line:
-                        self.tasks.append(self.TASK_CLASS.parse(line, id=id))
-                        id += 1
+            numbered_lines = self._read_lines()
+            lines = [line for id, line in numbered_lines]
+
+            records = None
+            if self.use_cache:
+                cache_key = self._cache_key(self._loaded_signature, self._loaded_hash.hexdigest())
+                records = self._read_cache(cache_key)
+
+            if records is not None:
+                timings.count('cache records read', len(records))
+                self.tasks = [self.TASK_CLASS.from_record(record, id=id) for id, record in records]
+            else:
+                timings.count('lines parsed', len(numbered_lines))
+                workers = 1
+                if 0 < self.parallel_threshold <= len(numbered_lines):
+                    import multiprocessing
+                    workers = self.workers or multiprocessing.cpu_count()
+                if workers > 1:
+                    tasks = self._parse_parallel(numbered_lines, workers)
+                else:
+                    tasks = (self.TASK_CLASS.parse(line, id=id) for id, line in numbered_lines)
+                if self.use_cache:
+                    tasks = self._write_cache(cache_key, tasks)
+                self.tasks = list(tasks)
+
+            for task, line in zip(self.tasks, lines):
+                task.line = line
+                task.mark_clean()
+            self._loaded_count = len(self.tasks)
+
+    @timings.timed('refresh')
+    def refresh(self):
+        '''\
+        Bring the tasks up to date with the file, parsing only the lines that changed since it was loaded or saved.
+
+        A task whose line is unchanged is kept, even if the line has moved, in which case only its ID changes.  As
+        with load(), unsaved changes are thrown away.  Returns the TaskListChanges, all tasks being added if they
+        weren't loaded before.
+        '''
+        if self._tasks is None:
+            self.load()
+            return TaskListChanges(added=[(task.id, task) for task in self._tasks])
+        if not self.changed_on_disk():
+            return TaskListChanges()
+
+        # Unchanged tasks by the line they were read from, which is a key as good as any hash of it
+        reusable = {}
+        for task in self._tasks:
+            if task.line is not None and not task.is_dirty():
+                reusable.setdefault(task.line, []).append(task)
+        # Reused tasks get new IDs, so the old ones are noted first
+        old_tasks = [(task.id, task) for task in self._tasks]
+        self._reset()
+        tasks = []
+        parsed = 0
+        if os.path.exists(self.filename):
+            for id, line in self._read_lines():
+                candidates = reusable.get(line)
+                if candidates:
+                    task = candidates.pop()
+                    task.id = id
+                else:
+                    task = self.TASK_CLASS.parse(line, id=id)
+                    task.line = line
+                    task.mark_clean()
+                    parsed += 1
+                tasks.append(task)
+        self.tasks = tasks
+        self._loaded_count = len(tasks)
+        timings.count('lines parsed', parsed)
+        timings.count('tasks reused', len(tasks) - parsed)
+        return TaskListChanges.between(old_tasks, tasks)
+
+    def _parse_parallel(self, numbered_lines, workers):
+        '''\
+        Parse (id, line) pairs in a pool of processes, yielding the tasks in order.
+
+        The lines are split into a few chunks per process, and each chunk comes back as records, the same as the
+        parse cache holds, to be turned back into tasks here.  That's a little over half the work of parsing, so
+        this is only worthwhile for large files.
+        '''
+        chunk_size = -(-len(numbered_lines) // (workers * 4))
+        chunks = [(self.TASK_CLASS, numbered_lines[i:i + chunk_size]) for i in range(0, len(numbered_lines), chunk_size)]
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            for data in pool.imap(_parse_chunk, chunks):
+                for id, record in marshal.loads(data):
+                    yield self.TASK_CLASS.from_record(record, id=id)
+        finally:
+            pool.terminate()
+
+    def _next_task_id(self):
+        # Line numbers left blank by removed tasks aren't reused
+        last_id = super(TodoTxt, self)._next_task_id()
+        return max(last_id, self._next_id)
+
+    def append(self, task):
+        if self._tasks is None and self._partial is not None:
+            # Added after the tasks read by find(), still without loading the rest
+            task.id = self._next_id
+            self._partial_appended.append(task)
+        else:
+            super(TodoTxt, self).append(task)
+        self._next_id = task.id + 1
+        if self._id_index is not None:
+            self._id_index[task.id] = task
+
+    def remove(self, task):
+        super(TodoTxt, self).remove(task)
+        if self._id_index is not None:
+            self._id_index.pop(task.id, None)
+        # The task's line is left blank, so the file has to be rewritten
+        self._removed = True
+
+    def get_child(self, id):
+        if self._id_index is None:
+            self._id_index = dict((task.id, task) for task in self.tasks)
+        return self._id_index.get(id)
+
+    def iter_tasks(self):
+        '''\
+        Yield the top level tasks one at a time.
+
+        If the tasks haven't been loaded, each one is read from the cache or parsed from the file only when it's
+        needed, and none of them are kept, so memory use doesn't depend on the size of the file.
+        '''
+        if self._tasks is not None:
+            for task in self._tasks:
+                yield task
+            return
+        if not os.path.exists(self.filename):
+            return
+
+        cache_key = None
+        last_id = 0
+        if self.use_cache:
+            cache_key = self._cache_key(self._file_signature(), self._file_digest())
+            fp = self._open_cache(cache_key)
+            if fp is not None:
+                with fp:
+                    while True:
+                        try:
+                            entry = marshal.load(fp)
+                        except (EOFError, ValueError, TypeError):
+                            # A damaged cache, parse the remaining lines from the file instead
+                            break
+                        if entry is None:
+                            return
+                        last_id, record = entry
+                        if timings.enabled:
+                            timings.count('cache records read')
+                        yield self.TASK_CLASS.from_record(record, id=last_id)
+
+        with open(self.filename, 'r') as fp:
+            lines = itertools.dropwhile(lambda entry: entry[0] <= last_id, self._numbered_lines(fp))
+            if timings.enabled:
+                lines = timings.counted('lines parsed', lines)
+            tasks = (self.TASK_CLASS.parse(line, id=id) for id, line in lines)
+            if cache_key is not None and last_id == 0:
+                tasks = self._write_cache(cache_key, tasks)
+            for task in tasks:
+                yield task
+
+    def find(self, id):
+        '''\
+        Find a task by ID without loading the whole list if it isn't loaded already.
+
+        The top level task is read through the line offsets, parsing only its own line.  Tasks found this way can be
+        changed, and tasks appended, then saved without the rest of the list being loaded.  If the list is loaded
+        later, it has the same task objects.
+        '''
+        if self._tasks is not None:
+            return self.get(id)
+        ids = str(id).split('.', 1)
+        try:
+            top_id = int(ids[0])
+        except ValueError:
+            return None
+        if self.use_cache:
+            task = self._partial.get(top_id) if self._partial is not None else None
+            if task is None:
+                task = self._read_line_task(top_id)
+            if task is None:
+                return None
+            return task.get(ids[1]) if len(ids) > 1 else task
+        for task in self.iter_tasks():
+            if task.id == top_id:
+                return task.get(ids[1]) if len(ids) > 1 else task
+            if task.id > top_id:
+                break
+        return None
+
+    def _offsets_key(self, signature):
+        return (self.OFFSETS_VERSION, array.array('l').itemsize) + signature
 
+    @classmethod
+    def _scan_offsets(self, data):
+        # The offset of the start of each line, then the size of the data
+        offsets = array.array('l', [0])
+        size = len(data)
+        find = data.find
+        pos = find('\n')
+        while pos != -1:
+            offsets.append(pos + 1)
+            pos = find('\n', pos + 1)
+        if offsets[-1] != size:
+            offsets.append(size)
+        timings.count('lines scanned', len(offsets) - 1)
+        return offsets
+
+    def _read_offsets(self):
+        '''\
+        Return the file's signature, a memory map of it, and the offset of the start of each line and of its end.
+
+        The offsets are kept in a file next to the todo.txt file, and used as long as the size and modification time
+        match.  Otherwise the file is scanned for line ends, and the offsets written out again.  The memory map is
+        None for an empty file, and the signature None if there's no file.
+        '''
+        with open(self.filename, 'rb') as fp:
+            signature = self._file_signature()
+            size = os.fstat(fp.fileno()).st_size
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        key = self._offsets_key(signature)
+        try:
+            with open(self.offsets_filename, 'rb') as fp:
+                if marshal.load(fp) == key:
+                    offsets = array.array('l')
+                    offsets.fromstring(fp.read())
+                    if offsets and offsets[-1] == size:
+                        return signature, data, offsets
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            pass
+        offsets = self._scan_offsets(data or '')
+        # The file may have changed while it was scanned
+        if self._file_signature() == signature:
+            self._write_offsets(key, offsets)
+        return signature, data, offsets
+
+    def _write_offsets(self, key, offsets):
+        with self._write_sidecar(self.offsets_filename) as dump:
+            dump(key)
+            dump(offsets)
+
+    @classmethod
+    def _line_at(self, data, offsets, id):
+        # The line's text with its newline, or None if the offsets don't fall on line boundaries any more
+        start, end = offsets[id - 1], offsets[id]
+        if data is None or data.size() != offsets[-1] or (start and data[start - 1] != '\n'):
+            return None
+        raw = data[start:end]
+        if end < offsets[-1] and not raw.endswith('\n'):
+            return None
+        return raw
+
+    def _read_line_task(self, id):
+        '''\
+        Read and parse the top level task on the given line, or return None if it's blank or past the end.
+        '''
+        first = self._partial is None
+        if first:
+            if not os.path.exists(self.filename):
+                return None
+            self._partial_signature, data, self._offsets = self._read_offsets()
+            self._partial = {}
+            self._next_id = len(self._offsets)
+        else:
+            with open(self.filename, 'rb') as fp:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else None
+        try:
+            if not 0 < id < len(self._offsets):
+                return None
+            raw = self._line_at(data, self._offsets, id)
+            if raw is None and first and data is not None:
+                # The file changed without its size or modification time showing it, so the saved offsets are wrong
+                self._offsets = self._scan_offsets(data)
+                self._next_id = len(self._offsets)
+                self._write_offsets(self._offsets_key(self._partial_signature), self._offsets)
+                if not 0 < id < len(self._offsets):
+                    return None
+                raw = self._line_at(data, self._offsets, id)
+            if raw is None:
+                # Tasks already read may be out of date too
+                raise ConflictError(self.filename + " was changed by another program")
+        finally:
+            if data is not None:
+                data.close()
+        line = raw.strip()
+        if not line:
+            return None
+        timings.count('lines parsed')
+        task = self.TASK_CLASS.parse(line, id=id)
+        task.line = line
+        task.mark_clean()
+        self._partial[id] = task
+        self._partial_lines[id] = raw
+        return task
+
+    def _merge_partial(self, partial, partial_lines, appended, signature):
+        # Put the tasks read on their own in place of the ones just loaded, as they may have been changed
+        if self._loaded_signature != signature:
+            raise ConflictError(self.filename + " was changed by another program")
+        positions = dict((task.id, pos) for pos, task in enumerate(self._tasks))
+        for id, task in partial.items():
+            self._tasks[positions[id]] = task
+        self._id_index = None
+        for task in appended:
+            self.append(task)
+
+    def _save_partial(self):
+        '''\
+        Write out the tasks read by find() and the ones appended since, without loading the rest.
+
+        Changed lines that are still the same length are overwritten where they are.  Otherwise the file is written
+        out again with the new lines in place of the old, which needs no other line parsed either.  New tasks are
+        appended.  Each line keeps the ending it had, and new ones take the ending of the last line.
+        '''
+        changed = sorted((id, str(task)) for id, task in self._partial.items() if task.is_dirty())
+        appended = [str(task) for task in self._partial_appended]
+        if not changed and not appended:
+            return
+        self.check_unchanged()
+        offsets = self._offsets
+        size = offsets[-1]
+        saved_at = time.time()
+        with open(self.filename, 'r+b') as fp:
+            # The size and modification time can miss a change, the lines themselves can't
+            for id, line in changed:
+                fp.seek(offsets[id - 1])
+                if fp.read(offsets[id] - offsets[id - 1]) != self._partial_lines[id]:
+                    raise ConflictError(self.filename + " was changed by another program")
+            tail = ''
+            if appended:
+                newline = '\n'
+                if size:
+                    fp.seek(max(size - 2, 0))
+                    end = fp.read(2)
+                    if end.endswith('\r\n'):
+                        newline = '\r\n'
+                    elif not end.endswith('\n'):
+                        tail = newline
+                tail += newline.join(appended) + newline
+            if all(len(line) == len(self._partial_lines[id].rstrip('\r\n')) for id, line in changed):
+                for id, line in changed:
+                    fp.seek(offsets[id - 1])
+                    fp.write(line)
+                fp.seek(size)
+                fp.write(tail)
+                fp.flush()
+                os.fsync(fp.fileno())
+                timings.count('bytes written', sum(len(line) for id, line in changed) + len(tail))
+                data = None
+            else:
+                fp.seek(0)
+                data = fp.read()
+        if data is None:
+            # A newline added to the old last line moves its end
+            new_offsets = offsets[:-1] if tail.startswith('\n') else offsets
+            new_offsets.extend(size + offset for offset in self._scan_offsets(tail)[1:])
+        else:
+            parts = []
+            pos = 0
+            for id, line in changed:
+                start, end = offsets[id - 1], offsets[id]
+                parts.append(data[pos:start])
+                old = data[start:end]
+                parts.append(line + old[len(old.rstrip('\r\n')):])
+                pos = end
+            parts.append(data[pos:])
+            parts.append(tail)
+            data = ''.join(parts)
+            self._write_atomic(data, check=self.check_unchanged)
+            timings.count('bytes written', len(data))
+            new_offsets = self._scan_offsets(data)
+
+        self._partial_signature = self._file_signature()
+        self._offsets = new_offsets
+        self._write_offsets(self._offsets_key(self._partial_signature), new_offsets)
+        for task in self._partial_appended:
+            self._partial[task.id] = task
+        self._partial_appended = []
+        for id, task in self._partial.items():
+            if task.is_dirty() or id not in self._partial_lines:
+                task.line = str(task)
+                task.mark_clean()
+                # Whatever follows the line is its ending
+                ending = new_offsets[id] - new_offsets[id - 1] - len(task.line)
+                self._partial_lines[id] = task.line + ('\r\n'[-ending:] if ending else '')
+        self._loaded_at = saved_at
+
+    def _open_cache(self, cache_key):
+        # The cache holds the key, then an (ID, record) pair per top level task, then None
+        try:
+            fp = open(self.cache_filename, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            if marshal.load(fp) == cache_key:
+                return fp
+        except (EOFError, ValueError, TypeError):
+            pass
+        fp.close()
+        return None
+
+    def _read_cache(self, cache_key):
+        fp = self._open_cache(cache_key)
+        if fp is None:
+            return None
+        records = []
+        with fp:
+            try:
+                for id, record in iter(lambda: marshal.load(fp), None):
+                    records.append((id, record))
+            except (EOFError, ValueError, TypeError):
+                return None
+        return records
+
+    def _write_cache(self, cache_key, tasks):
+        '''\
+        Pass through an iterable of tasks, writing each to a new cache as it goes.
+
+        The new cache only replaces the old one if every task was seen and the file didn't change meanwhile.
+        '''
+        complete = False
+        keep = lambda: complete and self._cache_key(self._file_signature(), cache_key[-1]) == cache_key
+        with self._write_sidecar(self.cache_filename, keep) as dump:
+            dump(cache_key)
+            for task in tasks:
+                dump((task.id, task.to_record()))
+                yield task
+            dump(None)
+            complete = True
+
+    @timings.timed('save')
     def save(self):
-        with open(self.filename, 'w') as fp:
-            fp.write(str(self))
+        '''\
+        Write the tasks back to the file, raising ConflictError if something else has changed it since it was loaded.
+        '''
+        with self.locked():
+            if self._tasks is None and self._partial is not None:
+                self._save_partial()
+            else:
+                self._save()
+
+    def _save(self):
+        tasks = self.tasks
+        saved_at = time.time()
+        loaded = self._loaded_count
+        appendable = (
+            loaded > 0
+            and not self._removed
+            and self._loaded_signature is not None
+            and self._file_signature() == self._loaded_signature
+            and all(task.line is not None and not task.is_dirty() for task in tasks[:loaded])
+            and all(task.line is None for task in tasks[loaded:])
+        )
+
+        if appendable:
+            # Only new tasks were added, so they are appended to the file as it is
+            written = tasks[loaded:]
+            new_lines = map(str, written)
+            if new_lines:
+                out = self._pad_lines(written, new_lines, self._line_count)
+                newline = self._newline
+                if self._ends_with_newline:
+                    data = newline.join(out) + newline
+                else:
+                    data = newline + newline.join(out)
+                # As late as possible, to leave programs that don't take the lock the least chance to slip in
+                self.check_unchanged()
+                with open(self.filename, 'a') as fp:
+                    fp.write(data)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                self._loaded_hash = self._loaded_hash.copy()
+                self._loaded_hash.update(data)
+                self._line_count += len(out)
+                timings.count('bytes written', len(data))
+        else:
+            # Unchanged tasks are written back exactly as they were read
+            written = tasks
+            new_lines = [task.line if task.line is not None and not task.is_dirty() else str(task) for task in tasks]
+            out = self._pad_lines(written, new_lines, 0)
+            # Keep the blank lines of tasks removed from the end, so their IDs aren't handed out again
+            out.extend([''] * (self._next_id - len(out) - 1))
+            data = '\n'.join(out)
+            if self._ends_with_newline or (out and not out[-1]):
+                data += '\n'
+            self._write_atomic(data, check=self.check_unchanged)
+            timings.count('bytes written', len(data))
+            self._loaded_hash = hashlib.sha1(data)
+            self._line_count = len(out)
+            self._ends_with_newline = data.endswith('\n')
+            self._newline = '\n'
+
+        for task, line in zip(written, new_lines):
+            task.line = line
+            task.mark_clean()
+        self._loaded_count = len(tasks)
+        self._loaded_signature = self._file_signature()
+        self._loaded_at = saved_at
+        self._removed = False
+
+    @classmethod
+    def _pad_lines(self, tasks, lines, line_count):
+        # Blank lines go before each task as needed so it ends up on the line matching its ID
+        out = []
+        for task, line in zip(tasks, lines):
+            out.extend([''] * (task.id - line_count - len(out) - 1))
+            out.append(line)
+        return out
+
+    def completed_tasks(self):
+        # (parent, task) pairs for archive()
+        return [(self, task) for task in self.tasks if task.completed]
+
+    def archive(self, done_filename, moved=None, **kwargs):
+        '''\
+        Move the completed tasks, or the given (parent, task) pairs, to the end of another file, then save.
+
+        Each task leaves a blank line behind, so the remaining tasks keep their IDs.  The tasks are written out
+        before they're removed here, so a failure part way through can only leave a task in both files, never in
+        neither.  Returns the moved (parent, task) pairs.
+        '''
+        with self.locked():
+            # Check before anything is written to the done file, so a conflict doesn't leave tasks in both
+            self.check_unchanged()
+            return self._archive(done_filename, moved, **kwargs)
+
+    def _archive(self, done_filename, moved, **kwargs):
+        if moved is None:
+            moved = self.completed_tasks(**kwargs)
+        if not moved:
+            return moved
+        done_filename = os.path.abspath(os.path.normpath(os.path.expanduser(done_filename)))
+        with open(done_filename, 'a+') as fp:
+            # Don't run on from a last line without a newline
+            fp.seek(0, os.SEEK_END)
+            done_size = fp.tell()
+            if done_size > 0:
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != '\n':
+                    fp.write('\n')
+            for parent, task in moved:
+                fp.write((task.line if parent is self and task.line is not None and not task.is_dirty() else str(task)) + '\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+        for parent, task in moved:
+            parent.remove(task)
+        try:
+            self.save()
+        except ConflictError:
+            # Nothing was saved, so the tasks come back out of the done file rather than being written twice on a retry
+            with open(done_filename, 'r+') as fp:
+                fp.truncate(done_size)
+            raise
+        return moved
+
+    def _write_atomic(self, data, check=None):
+        # Write to a temporary file next to the real one, then rename it into place so a failure part way through
+        # never leaves a truncated file behind.  check is called just before the rename, as late as possible to
+        # leave programs that don't take the lock the least chance to slip in
+        import tempfile
+        dirname, basename = os.path.split(self.filename)
+        fd, tmp_filename = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+            if os.path.exists(self.filename):
+                os.chmod(tmp_filename, stat.S_IMODE(os.stat(self.filename).st_mode))
+            if check is not None:
+                check()
+            os.rename(tmp_filename, self.filename)
+        except Exception:
+            if os.path.exists(tmp_filename):
+                os.unlink(tmp_filename)
+            raise
+
+    @contextlib.contextmanager
+    def _write_sidecar(self, filename, keep=None):
+        '''\
+        Write a file kept next to the real one, like the cache, yielding a function that adds a value to it.
+
+        Values are marshalled, except for arrays which are written raw.  The new file replaces the old one at the end
+        if keep, when given, returns true.  These files are only an optimization, so failing to write one is not an
+        error: the values after the failure are dropped and the old file is left alone.
+        '''
+        import tempfile
+        dirname, basename = os.path.split(filename)
+        try:
+            fd, tmp_filename = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname)
+            files = [os.fdopen(fd, 'wb')]
+        except (IOError, OSError):
+            tmp_filename, files = None, [None]
+
+        def dump(value):
+            fp = files[0]
+            if fp is None:
+                return
+            try:
+                if type(value) is array.array:
+                    value.tofile(fp)
+                else:
+                    marshal.dump(value, fp)
+            except (IOError, OSError, ValueError):
+                files[0] = None
+                fp.close()
+
+        try:
+            yield dump
+            fp, files[0] = files[0], None
+            if fp is not None:
+                try:
+                    fp.close()
+                    if keep is None or keep():
+                        os.rename(tmp_filename, filename)
+                        tmp_filename = None
+                except (IOError, OSError):
+                    pass
+        finally:
+            if files[0] is not None:
+                files[0].close()
+            if tmp_filename is not None:
+                try:
+                    os.unlink(tmp_filename)
+                except OSError:
+                    pass
 
     def __str__(self):
         return '\n'.join(map(str, self.tasks))
 
 
+class TaskListChanges(object):
+    '''\
+    The top level tasks added, removed, and changed between two versions of a task list, by ID.
+
+    added and removed are lists of (ID, task) pairs, and changed of (ID, old task, new task).  As IDs are line
+    numbers, a line inserted or removed shows up as a change to each of the lines after it.
+    '''
+
+    def __init__(self, added=None, removed=None, changed=None):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+
+    @classmethod
+    def between(self, old_tasks, new_tasks):
+        # The old tasks are (ID, task) pairs, as their IDs may have changed since
+        old = dict(old_tasks)
+        added = []
+        changed = []
+        for task in new_tasks:
+            before = old.pop(task.id, None)
+            if before is None:
+                added.append((task.id, task))
+            elif before is not task and (before.is_dirty() or before.line != task.line):
+                changed.append((task.id, before, task))
+        removed = sorted(old.items())
+        return self(added, removed, changed)
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self):
+        return '{} added, {} changed, {} removed'.format(len(self.added), len(self.changed), len(self.removed))
+
+
+def _parse_chunk(args):
+    # Runs in a worker process for TodoTxt._parse_parallel(), marshal being much quicker than pickle for records
+    task_class, numbered_lines = args
+    return marshal.dumps([(id, task_class.parse(line, id=id).to_record()) for id, line in numbered_lines])
+
+
+class TagAttribute(object):
+    '''\
+    A task attribute backed by a tag.
+
+    The raw tag value is only decoded (using the task's TAG_PARSERS) the first time the attribute is read.  Setting
+    the attribute marks the tag as changed so it will be re-encoded when the task is written out, otherwise the raw
+    tag value is written back unchanged.
+    '''
+
+    def __init__(self, tag):
+        self.tag = tag
+        # The decoded value is kept in this slot, which is unset until the first access
+        self.slot = self.slot_name(tag)
+
+    @classmethod
+    def slot_name(self, tag):
+        return '_tag_' + tag
+
+    def __get__(self, task, cls):
+        if task is None:
+            return self
+        try:
+            return getattr(task, self.slot)
+        except AttributeError:
+            parser, _ = task.TAG_PARSERS[self.tag]
+            value = task.tags.get(self.tag)
+            value = parser(task, value) if value else None
+            setattr(task, self.slot, value)
+            return value
+
+    def __set__(self, task, value):
+        setattr(task, self.slot, value)
+        task._changed_tags = task._changed_tags | frozenset([self.tag])
+        task.dirty = True
+        task._rendered = None
+
+
 class TMTask(TaskListMixin, Task):
     TASK_LIST_ATTR = 'subtasks'
+    TRACKED_FIELDS = Task.TRACKED_FIELDS | frozenset(['subtasks'])
+    escape_re = re.compile(ur'(^|\s)(\\*(?:&&)+)(?=[^&]|$)')
 
-    def _parse_rrule(self, value):
-        rset = rrule.rruleset()
+    def _parse_due(self, value):
+        return parse_date(value)
+
+    def _str_due(self, value):
+        return format_date(value)
+
+    # Parsed rrule tags, shared by every task with the same tag, see _parse_rrule_parts()
+    _rrule_cache = {}
+
+    @classmethod
+    def _parse_rrule_parts(self, value):
+        '''\
+        Parse an rrule tag into a list of (kind, value, floating) parts, where floating rules start at the task's due
+        date rather than their own DTSTART.
+        '''
+        try:
+            return self._rrule_cache[value]
+        except KeyError:
+            pass
+        # Replaced by the due date for rules without their own DTSTART
+        placeholder_start = parse_date('2000-01-01')
+        parts = []
         for candidate in value.split(';;;'):
             candidate = candidate.replace(';;', '\n')
             if candidate.startswith('RRULE:'):
-                rset.rrule(rrule.rrulestr(candidate[6:], dtstart=self.due or pendulum.utcnow()))
+                rule = rrule.rrulestr(candidate[6:], dtstart=placeholder_start)
+                parts.append(('RRULE', rule, 'DTSTART' not in candidate))
+                timings.count('rrules built')
             elif candidate.startswith('EXRULE:'):
-                rset.exrule(rrule.rrulestr('RRULE:' + candidate[7:], dtstart=self.due or pendulum.utcnow()))
+                rule = rrule.rrulestr('RRULE:' + candidate[7:], dtstart=placeholder_start)
+                parts.append(('EXRULE', rule, 'DTSTART' not in candidate))
+                timings.count('rrules built')
             elif candidate.startswith('RDATE:'):
-                rset.rdate(pendulum.parse(candidate[6:]))
+                parts.append(('RDATE', pendulum.parse(candidate[6:]), False))
             elif candidate.startswith('EXDATE:'):
-                rset.exdate(pendulum.parse(candidate[7:]))
+                parts.append(('EXDATE', pendulum.parse(candidate[7:]), False))
+        return _cache_date(self._rrule_cache, value, parts)
+
+    @classmethod
+    def build_rruleset(self, value, dtstart):
+        rset = rrule.rruleset()
+        for kind, part, floating in self._parse_rrule_parts(value):
+            if kind == 'RRULE' or kind == 'EXRULE':
+                # Always a copy, since next() changes the rules of the set it's given
+                part = part.replace(dtstart=dtstart) if floating else part.replace()
+            {
+                'RRULE': rset.rrule,
+                'EXRULE': rset.exrule,
+                'RDATE': rset.rdate,
+                'EXDATE': rset.exdate,
+            }[kind](part)
         return rset
 
+    def _parse_rrule(self, value):
+        return self.build_rruleset(value, self.due or pendulum.utcnow())
+
     def _str_rruleset(self, value):
         out = []
         values = [
@@ -271,50 +1511,125 @@ class TMTask(TaskListMixin, Task):
                 out.append(prefix + ':' + str(v).replace('\n', ';;'))
         return ';;;'.join(out)
 
+    TAG_PARSERS = OrderedDict([
+        ('due', (_parse_due, _str_due)),
+        ('rrule', (_parse_rrule, _str_rruleset)),
+    ])
+
+    due = TagAttribute('due')
+    rrule = TagAttribute('rrule')
+
+    __slots__ = ('subtasks', '_changed_tags') + tuple([TagAttribute.slot_name(tag) for tag in TAG_PARSERS])
+
     def __init__(self, *args, **kwargs):
-        self.TAG_PARSERS = OrderedDict([
-            ('due', (parse_date, format_date)),
-            ('rrule', (self._parse_rrule, self._str_rruleset)),
-        ])
-        self.subtasks = kwargs.pop('subtasks', [])
+        object.__setattr__(self, 'subtasks', kwargs.pop('subtasks', None) or EMPTY_LIST)
+        # Tag attributes are decoded from self.tags on first access, see parse_tags()
+        object.__setattr__(self, '_changed_tags', EMPTY_SET)
         depth = kwargs.pop('depth', 0)
         parse_description = kwargs.pop('parse_description', False)
         super(TMTask, self).__init__(*args, **kwargs)
         if parse_description:
             self.parse_description(depth=depth)
-        self.parse_tags()
 
-    def parse_description(self, depth=0):
-        new_description = []
-        found_subtasks = False
-        subtask_id = 1
-        candidates = re.split(ur'(\s+' + ('&&' * (depth + 1)) + '[^&])', self.description)
-        while candidates:
-            candidate = candidates.pop(0)
-            if candidate.strip().startswith('&&' * (depth + 1)):
-                found_subtasks = True
-                candidate = (candidate + candidates.pop(0)).strip().lstrip('&')
-                self.subtasks.append(TMTask.parse(candidate, depth=depth + 1, id=subtask_id))
-                subtask_id += 1
-            elif not found_subtasks:
-                new_description.append(candidate)
-
-        self.description = ''.join(new_description)
-        super(TMTask, self).parse_description()
+    def parse_description(self, tokens=None, depth=0):
+        if tokens is None:
+            tokens = tokenize(self.description)
+
+        # Walk the tokens once, splitting them between this task and its subtasks.  A subtask marker is a word
+        # starting with 2 ampersands per level; it may start at most one level below the current task.  Each frame
+        # is [depth, tokens, subtasks, parse_prefix] for a task whose marker has been seen but that isn't built yet.
+        frames = [[depth, [], list(self.subtasks), False]]
+        after_bare_marker = False
+        count = len(tokens)
+        for i, (word, ws) in enumerate(tokens):
+            if word[0] == '&' and i > 0 and not after_bare_marker:
+                content = word.lstrip('&')
+                ampersands = len(word) - len(content)
+                level = ampersands // 2
+                if ampersands % 2 == 0 and depth < level <= frames[-1][0] + 1 and (content or i + 1 < count):
+                    while frames[-1][0] >= level:
+                        self._build_subtask(frames.pop(), frames[-1][2])
+                    # A bare marker is separated from its subtask by whitespace, which is then taken as-is
+                    frames.append([level, [(content, ws)] if content else [], [], bool(content)])
+                    after_bare_marker = not content
+                    continue
+            elif word[0] == '\\' and self.escape_re.match(word):
+                # Escaped subtask marker in a description, see format_description()
+                word = word[1:]
+            after_bare_marker = False
+            frames[-1][1].append((word, ws))
+
+        while len(frames) > 1:
+            self._build_subtask(frames.pop(), frames[-1][2])
+        object.__setattr__(self, 'subtasks', frames[0][2] or EMPTY_LIST)
+        super(TMTask, self).parse_description(frames[0][1])
+
+    def _build_subtask(self, frame, siblings):
+        _, tokens, subtasks, parse_prefix = frame
+        if parse_prefix:
+            args, start = self.parse_prefix(tokens)
+        else:
+            args, start = {}, 0
+        task = self.__class__('', id=len(siblings) + 1, subtasks=subtasks, **args)
+        super(TMTask, task).parse_description(tokens[start:])
+        siblings.append(task)
+
+    def format_description(self):
+        # Words in the description that would be read as subtask markers are escaped with a backslash
+        if '&&' not in self.description:
+            return self.description
+        return self.escape_re.sub(r'\1\\\2', self.description)
+
+    def __setattr__(self, name, value):
+        if name == 'tags':
+            # Decoded tag attributes go stale with the raw values they came from, unless they were set since
+            for tag in self.TAG_PARSERS:
+                slot = TagAttribute.slot_name(tag)
+                if tag not in self._changed_tags and self.tags.get(tag) != value.get(tag) and hasattr(self, slot):
+                    delattr(self, slot)
+        super(TMTask, self).__setattr__(name, value)
 
     def parse_tags(self):
-        for tag, (parser, _) in self.TAG_PARSERS.items():
-            setattr(self, tag, None)
-            if self.tags.get(tag):
-                setattr(self, tag, parser(self.tags[tag]))
+        # Tag attributes are decoded from self.tags on first access
+        for tag in self.TAG_PARSERS:
+            slot = TagAttribute.slot_name(tag)
+            if hasattr(self, slot):
+                delattr(self, slot)
+        self._changed_tags = EMPTY_SET
 
-    def _make_string(self, depth=0, include_subtasks=True):
-        for tag, (_, stringifier) in self.TAG_PARSERS.items():
-            if getattr(self, tag) is None:
-                if tag in self.tags:
-                    del self.tags[tag]
+    def append(self, task):
+        super(TMTask, self).append(task)
+        self.dirty = True
+
+    def remove(self, task):
+        super(TMTask, self).remove(task)
+        self.dirty = True
+
+    def is_dirty(self):
+        return self.dirty or any(task.is_dirty() for task in self.subtasks)
+
+    def mark_clean(self):
+        super(TMTask, self).mark_clean()
+        for task in self.subtasks:
+            task.mark_clean()
+
+    def encode_tags(self):
+        if not self._changed_tags:
+            return
+        tags = dict(self.tags)
+        for tag in self._changed_tags:
+            _, stringifier = self.TAG_PARSERS[tag]
+            value = getattr(self, TagAttribute.slot_name(tag))
+            if value is None:
+                tags.pop(tag, None)
             else:
-                self.tags[tag] = stringifier(getattr(self, tag))
+                tags[tag] = stringifier(self, value)
+        self.tags = tags or EMPTY_DICT
+        # Encoded now, so later renders can skip this until a tag attribute is set again
+        self._changed_tags = EMPTY_SET
+
+    def _make_string(self, depth=0, include_subtasks=True):
+        self.encode_tags()
 
         out = super(TMTask, self).__str__()
         if include_subtasks:
@@ -326,10 +1641,76 @@ class TMTask(TaskListMixin, Task):
     def __str__(self):
         return self._make_string()
 
+    def to_record(self):
+        self.encode_tags()
+        return (super(TMTask, self).to_record(), [t.to_record() for t in self.subtasks])
+
+    @classmethod
+    def from_record(self, record, **kwargs):
+        fields, subtasks = record
+        kwargs['subtasks'] = [self.from_record(r, id=id) for id, r in enumerate(subtasks, 1)]
+        return super(TMTask, self).from_record(fields, **kwargs)
+
     def clone(self):
-        out = super(TMTask, self).clone()
-        out.parse_tags()
-        return out
+        self.encode_tags()
+        return super(TMTask, self).clone()
+
+    def occurrences(self, start, end):
+        '''\
+        Yield the due date and every recurrence of this task from start up to, but not including, end in order.
+
+        Recurrences are the datetimes produced by the rule set, which are naive if the rule has its own DTSTART.
+        '''
+        due = self.due
+        if due is None:
+            return
+        rset = self.rrule
+        if rset and due < start:
+            rset = self._skip_rruleset(rset, start)
+        dates = rset.xafter(start, inc=True) if rset else iter(())
+        if due >= start:
+            dates = heapq.merge([due], dates)
+        previous = None
+        for date in dates:
+            if date >= end:
+                break
+            if date != previous:
+                yield date
+            previous = date
+
+    @classmethod
+    def _skip_rule(self, rule, start):
+        '''\
+        Move a daily or weekly rule's start forward to shortly before start, keeping it in step with the original.
+
+        Rules are expanded from their start, so this saves stepping through every occurrence of an old rule.  Rules
+        with a count, or that pick occurrences by position, depend on every earlier occurrence and are left as is.
+        '''
+        if rule._freq == rrule.DAILY:
+            step = rule._interval
+        elif rule._freq == rrule.WEEKLY:
+            step = 7 * rule._interval
+        else:
+            return rule
+        if rule._count or rule._bysetpos:
+            return rule
+        gap = (start.date() - rule._dtstart.date()).days
+        if gap <= step:
+            return rule
+        return rule.replace(dtstart=rule._dtstart + datetime.timedelta(days=(gap // step - 1) * step))
+
+    @classmethod
+    def _skip_rruleset(self, rset, start):
+        skipped = rrule.rruleset()
+        for rule in rset._rrule:
+            skipped.rrule(self._skip_rule(rule, start))
+        for rule in rset._exrule:
+            skipped.exrule(self._skip_rule(rule, start))
+        for date in rset._rdate:
+            skipped.rdate(date)
+        for date in rset._exdate:
+            skipped.exdate(date)
+        return skipped
 
     def next(self):
         if not self.rrule:
@@ -337,26 +1718,701 @@ class TMTask(TaskListMixin, Task):
         new_task = self.clone()
         new_task.completed = False
         new_task.completed_at = None
-        new_task.due = pendulum.instance(new_task.rrule.after(new_task.due or pendulum.utcnow()))
-        for rule in new_task.rrule._rrule + new_task.rrule._exrule:
+        rset = new_task.rrule
+        new_task.due = pendulum.instance(rset.after(new_task.due or pendulum.utcnow()))
+        for rule in rset._rrule + rset._exrule:
             rule._dtstart = new_task.due
+        new_task.rrule = rset
         return new_task
 
+    # The fields of export_record(), in the order CSV columns are written
+    EXPORT_FIELDS = ('id', 'completed', 'completed_at', 'priority', 'created_at', 'description', 'projects', 'contexts', 'tags', 'due', 'rrule')
+
+    def export_record(self, id):
+        '''\
+        The task, without its subtasks, as a dict of plain values with id as its dotted ID.
+        '''
+        self.encode_tags()
+        tags = dict(self.tags)
+        tags.pop('due', None)
+        rrule = tags.pop('rrule', None)
+        # A plain dict rather than an OrderedDict, which is several times slower to build and to encode as JSON
+        return {
+            'id': id,
+            'completed': self.completed,
+            'completed_at': format_date(self.completed_at) if self.completed_at else None,
+            'priority': chr((26 - self.priority) + 65) if self.priority is not None else None,
+            'created_at': None if self.created_at_default else format_date(self.created_at),
+            'description': self.description,
+            'projects': list(self.projects),
+            'contexts': list(self.contexts),
+            'tags': tags,
+            'due': TaskQuery.due_key(self),
+            'rrule': rrule,
+        }
+
+    @classmethod
+    def import_record(self, record):
+        '''\
+        Make a task from a dict like those from export_record(), ignoring the ID.  Raises ValueError for an invalid
+        field.
+        '''
+        priority = record.get('priority') or None
+        if priority is not None:
+            if len(priority) != 1 or not 'A' <= priority <= 'Z':
+                raise ValueError("Invalid priority: " + priority)
+            priority = 26 - (ord(priority) - 65)
+        dates = {}
+        for field in ('created_at', 'completed_at', 'due'):
+            if record.get(field):
+                try:
+                    dates[field] = parse_date(record[field])
+                except Exception:
+                    raise ValueError("Invalid date: " + record[field])
+        tags = dict(record.get('tags') or EMPTY_DICT)
+        # The raw values are kept, and only parsed if they're used
+        for tag in ('due', 'rrule'):
+            if record.get(tag):
+                tags[tag] = record[tag]
+        return self(
+            record.get('description') or '',
+            completed=bool(record.get('completed')),
+            priority=priority,
+            created_at=dates.get('created_at'),
+            completed_at=dates.get('completed_at'),
+            projects=list(record.get('projects') or EMPTY_LIST),
+            contexts=list(record.get('contexts') or EMPTY_LIST),
+            tags=tags,
+        )
+
+
+class QueryError(ValueError):
+    pass
+
+
+class TaskQuery(object):
+    '''\
+    A filter expression for a task list.
+
+    A query is a list of terms, all of which must match:
+
+      +project, @context     Task belongs to the project or context
+      tag:key, tag:key=value Task has the tag, optionally with the given value
+      due<DATE, pri>=B       Due date or priority comparison, using one of <, <=, =, >=, >
+      done                   Task is completed
+
+    Any term may be negated by prefixing it with "!".  A higher priority compares greater, so pri>=B matches tasks
+    with priority A or B.
+    '''
+
+    comparison_re = re.compile(ur'^(due|pri)(<=|>=|<|>|=)(.+)$')
+    OPERATORS = {
+        '<': operator.lt,
+        '<=': operator.le,
+        '=': operator.eq,
+        '>=': operator.ge,
+        '>': operator.gt,
+    }
+
+    def __init__(self, terms):
+        self.terms = [self.parse_term(term) for term in terms]
+
+    @classmethod
+    def parse_term(self, term):
+        negate = term.startswith('!')
+        if negate:
+            term = term[1:]
+
+        if term.startswith('+') and len(term) > 1:
+            return negate, 'project', term[1:]
+        elif term.startswith('@') and len(term) > 1:
+            return negate, 'context', term[1:]
+        elif term.startswith('tag:') and len(term) > 4:
+            key, _, value = term[4:].partition('=')
+            return negate, 'tag', (key, value or None)
+        elif term == 'done':
+            return negate, 'done', None
+
+        match = self.comparison_re.match(term)
+        if match:
+            field, op, value = match.groups()
+            if field == 'due':
+                try:
+                    value = format_date(parse_date(value))
+                except ValueError:
+                    raise QueryError("Invalid date: " + value)
+            else:
+                if not re.match(ur'^[A-Z]$', value):
+                    raise QueryError("Invalid priority: " + value)
+                value = 26 - (ord(value) - 65)
+            return negate, field, (op, value)
+
+        raise QueryError("Invalid filter: " + term)
+
+    @classmethod
+    def due_key(self, task):
+        # Due dates compare as YYYY-MM-DD strings, which is usually just the raw tag value
+        task.encode_tags()
+        value = task.tags.get('due')
+        if not value:
+            return None
+        return value if date_only_re.match(value) else format_date(task.due)
+
+    def term_matches(self, task, field, value):
+        if field == 'project':
+            return value in task.projects
+        elif field == 'context':
+            return value in task.contexts
+        elif field == 'tag':
+            key, tag_value = value
+            task.encode_tags()
+            return key in task.tags and (tag_value is None or task.tags[key] == tag_value)
+        elif field == 'done':
+            return task.completed
+        elif field == 'pri':
+            op, priority = value
+            return task.priority is not None and self.OPERATORS[op](task.priority, priority)
+        elif field == 'due':
+            op, date = value
+            due = self.due_key(task)
+            return due is not None and self.OPERATORS[op](due, date)
+
+    def matches(self, task):
+        for negate, field, value in self.terms:
+            if bool(self.term_matches(task, field, value)) == negate:
+                return False
+        return True
+
+
+class TaskSort(object):
+    '''\
+    An order for a task list, given as a comma separated list of fields such as "due,priority".
+
+      due        Soonest due first.  A subtask without a due date of its own is due when its parent is.
+      priority   Highest priority first
+      created    Oldest first
+
+    Tasks without a value for a field come after those with one, and tasks that compare equal stay in list order.
+    '''
+
+    FIELDS = ('due', 'priority', 'created')
+
+    def __init__(self, spec):
+        self.fields = tuple(field.strip() for field in spec.split(','))
+        for field in self.fields:
+            if field not in self.FIELDS:
+                raise QueryError("Invalid sort field: " + field)
+
+    def key(self, task, due):
+        # due is the task's due date as from TaskQuery.due_key(), or the one it inherits
+        out = []
+        for field in self.fields:
+            if field == 'due':
+                out.append(due is None)
+                out.append(due)
+            elif field == 'priority':
+                out.append(-(task.priority or 0))
+            elif field == 'created':
+                out.append(task.format_created_at())
+        return tuple(out)
+
+    @classmethod
+    def inherit_due(self, entries):
+        '''\
+        Pair each (id, depth, task) entry, in tree order, with its due date or that of its nearest ancestor with one.
+        '''
+        stack = []
+        for entry in entries:
+            # The ancestors' due dates, one per level above this entry
+            del stack[entry[1]:]
+            due = TaskQuery.due_key(entry[2])
+            if due is None and stack:
+                due = stack[-1]
+            stack.append(due)
+            yield entry, due
+
+    def select(self, keyed_entries, limit=None):
+        '''\
+        Order (key, entry) pairs, returning only the first limit entries if given.
+
+        With a limit only that many entries are kept in a heap, rather than sorting them all.
+        '''
+        if limit is not None:
+            keyed_entries = heapq.nsmallest(limit, keyed_entries, key=operator.itemgetter(0))
+        else:
+            keyed_entries = sorted(keyed_entries, key=operator.itemgetter(0))
+        return [entry for key, entry in keyed_entries]
+
+
+class TaskIndex(object):
+    '''\
+    Secondary indexes over a task tree.
+
+    Every task and subtask is an entry of (dotted id, depth, task), numbered in tree order.  Each index maps a value to
+    the set of entry numbers that have it, so a query is answered by intersecting those sets.  The sort keys of each
+    order asked for are kept too, so they're only worked out once while the index lasts.
+    '''
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.projects = {}
+        self.contexts = {}
+        self.tags = {}
+        self.priorities = {}
+        self.completed = set()
+        self.inherited_due = []
+        self._sort_keys = {}
+        due = []
+
+        for pos, ((_, _, task), inherited_due) in enumerate(TaskSort.inherit_due(self.entries)):
+            self.inherited_due.append(inherited_due)
+            for project in task.projects:
+                self.projects.setdefault(project, set()).add(pos)
+            for context in task.contexts:
+                self.contexts.setdefault(context, set()).add(pos)
+            task.encode_tags()
+            for key, value in task.tags.items():
+                self.tags.setdefault((key, None), set()).add(pos)
+                self.tags.setdefault((key, value), set()).add(pos)
+            if task.priority is not None:
+                self.priorities.setdefault(task.priority, set()).add(pos)
+            if task.completed:
+                self.completed.add(pos)
+            due_key = TaskQuery.due_key(task)
+            if due_key is not None:
+                due.append((due_key, pos))
+
+        due.sort()
+        self.due_dates = [d for d, _ in due]
+        self.due_positions = [pos for _, pos in due]
+
+    def postings(self, field, value):
+        if field == 'project':
+            return self.projects.get(value, set())
+        elif field == 'context':
+            return self.contexts.get(value, set())
+        elif field == 'tag':
+            return self.tags.get(value, set())
+        elif field == 'done':
+            return self.completed
+        elif field == 'pri':
+            op, priority = value
+            compare = TaskQuery.OPERATORS[op]
+            out = set()
+            for candidate, positions in self.priorities.items():
+                if compare(candidate, priority):
+                    out |= positions
+            return out
+        elif field == 'due':
+            op, date = value
+            left = bisect.bisect_left(self.due_dates, date)
+            right = bisect.bisect_right(self.due_dates, date)
+            start, end = {
+                '<': (0, left),
+                '<=': (0, right),
+                '=': (left, right),
+                '>=': (left, None),
+                '>': (right, None),
+            }[op]
+            return set(self.due_positions[start:end])
+
+    def select(self, query=None, sort=None, limit=None):
+        positions = self.select_positions(query) if query is not None else xrange(len(self.entries))
+        if sort is not None:
+            keys = self.sort_keys(sort)
+            return sort.select(((keys[pos], self.entries[pos]) for pos in positions), limit)
+        return [self.entries[pos] for pos in itertools.islice(positions, limit)]
+
+    def sort_keys(self, sort):
+        keys = self._sort_keys.get(sort.fields)
+        if keys is None:
+            keys = self._sort_keys[sort.fields] = [sort.key(task, due) for (_, _, task), due in zip(self.entries, self.inherited_due)]
+        return keys
+
+    def select_positions(self, query):
+        include = []
+        exclude = []
+        for negate, field, value in query.terms:
+            (exclude if negate else include).append(self.postings(field, value))
+
+        if include:
+            include.sort(key=len)
+            result = set(include[0])
+            for positions in include[1:]:
+                result &= positions
+        else:
+            result = set(range(len(self.entries)))
+        for positions in exclude:
+            result -= positions
+
+        return sorted(result)
+
+
+class SearchQuery(object):
+    '''\
+    Words to look for in task descriptions.
+
+    A task must have every word, unless words are joined by OR, when any one of them will do.  A word ending in * also
+    matches longer words starting with it.  Case and punctuation are ignored, so a term like e-mail is the two words e
+    and mail.
+    '''
+
+    def __init__(self, terms):
+        # Groups that must all match, each a list of alternatives, each a tuple of (word, prefix) pairs that must all
+        # match
+        self.groups = []
+        joined = False
+        for term in ' '.join(terms).split():
+            if term == 'OR':
+                if not self.groups or joined:
+                    raise QueryError("OR must come between two words")
+                joined = True
+                continue
+            words = SearchIndex.words(term)
+            if not words:
+                raise QueryError("Nothing to search for in: " + term)
+            prefix = term.endswith('*')
+            alternative = tuple((word, prefix and i == len(words) - 1) for i, word in enumerate(words))
+            if joined:
+                self.groups[-1].append(alternative)
+            else:
+                self.groups.append([alternative])
+            joined = False
+        if joined:
+            raise QueryError("OR must come between two words")
+        if not self.groups:
+            raise QueryError("Nothing to search for")
+        # Whole words that must all be there are checked at once, the rest one group at a time
+        simple = [group for group in self.groups if len(group) == 1 and not any(prefix for word, prefix in group[0])]
+        self.required = frozenset(word for group in simple for word, prefix in group[0])
+        self.other_groups = [group for group in self.groups if group not in simple]
+        terms = [pair for group in self.groups for alternative in group for pair in alternative]
+        self.exact = frozenset(word for word, prefix in terms if not prefix)
+        self.prefixes = tuple(word for word, prefix in terms if prefix)
+
+    @classmethod
+    def _has(self, words, word, prefix):
+        if prefix:
+            return any(w.startswith(word) for w in words)
+        return word in words
+
+    def matches(self, words):
+        if not self.required.issubset(words):
+            return False
+        return all(any(all(self._has(words, word, prefix) for word, prefix in alternative) for alternative in group) for group in self.other_groups)
+
+    def score(self, words):
+        # The number of words in the description matching any term, counting repeats
+        exact = self.exact
+        prefixes = self.prefixes
+        return sum(1 for w in words if w in exact or (prefixes and w.startswith(prefixes)))
+
+
+class SearchIndex(object):
+    '''\
+    An inverted index of the words in the descriptions of every task and subtask.
+
+    Each word maps to the set of top level task IDs with it somewhere in their tree, and each top level ID to an
+    entry of (dotted id, priority, completed, words) per task in its tree.  A search narrows down the trees by
+    intersecting the sets, then checks the entries of each.  Trees are replaced whole when a task in them changes.
+
+    In the file each tree is marshalled on its own and each set is an array of IDs, and they're only decoded when
+    they're used, so a search reads little more than the trees it finds.
+    '''
+
+    VERSION = 1
+
+    # Non-ASCII bytes are kept in words, so UTF-8 text isn't split apart, but only ASCII letters are case folded
+    word_re = re.compile(r'[\w\x80-\xff]+')
+
+    def __init__(self, trees=None, words=None):
+        # Either may still be encoded, as read from the file
+        self.trees = trees if trees is not None else {}
+        self.words_index = words if words is not None else {}
+        self._sorted_words = None
+
+    @classmethod
+    def words(self, text):
+        # Interned, so each word is only stored once in memory and in the file
+        return map(intern_str, self.word_re.findall(text.lower()))
+
+    @classmethod
+    def key(self, signature):
+        return (self.VERSION, sys.hexversion, array.array('l').itemsize) + signature
+
+    def tree(self, top_id):
+        tree = self.trees.get(top_id)
+        if type(tree) is str:
+            tree = self.trees[top_id] = marshal.loads(tree)
+        return tree
+
+    def ids(self, word):
+        ids = self.words_index.get(word)
+        if type(ids) is str:
+            encoded = array.array('l')
+            encoded.fromstring(ids)
+            ids = self.words_index[word] = set(encoded)
+        return ids
+
+    def update(self, top_id, task):
+        '''\
+        Index a top level task and its subtasks in place of what was there before, or remove them if task is None.
+        '''
+        old = self.tree(top_id)
+        if old:
+            del self.trees[top_id]
+            for word in set(word for entry in old for word in entry[3]):
+                ids = self.ids(word)
+                ids.discard(top_id)
+                if not ids:
+                    del self.words_index[word]
+        if task is not None:
+            tree = [(id, t.priority or 0, t.completed, tuple(self.words(t.description))) for id, _, t in TMTodoTxt._walk_task_list([task])]
+            self.trees[top_id] = tree
+            for word in set(word for entry in tree for word in entry[3]):
+                ids = self.ids(word)
+                if ids is None:
+                    ids = self.words_index[word] = set()
+                ids.add(top_id)
+        self._sorted_words = None
+
+    def postings(self, word, prefix):
+        if not prefix:
+            return self.ids(word) or EMPTY_SET
+        # Words starting with the prefix are together in sorted order
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self.words_index)
+        out = set()
+        for pos in xrange(bisect.bisect_left(self._sorted_words, word), len(self._sorted_words)):
+            candidate = self._sorted_words[pos]
+            if not candidate.startswith(word):
+                break
+            out |= self.ids(candidate)
+        return out
+
+    def candidates(self, query):
+        # Top level IDs of the trees that have the words, though maybe not all in the same task
+        result = None
+        for group in query.groups:
+            group_ids = set()
+            for alternative in group:
+                postings = sorted((self.postings(word, prefix) for word, prefix in alternative), key=len)
+                ids = set(postings[0])
+                for other in postings[1:]:
+                    ids &= other
+                group_ids |= ids
+            result = group_ids if result is None else result & group_ids
+            if not result:
+                break
+        return result
+
+    def search(self, query, completed=False, limit=None):
+        '''\
+        Return (dotted id, score) pairs of the matching tasks, most matching words first, then highest priority.
+        '''
+        results = []
+        for top_id in self.candidates(query):
+            for pos, (id, priority, done, words) in enumerate(self.tree(top_id)):
+                if done and not completed:
+                    continue
+                if query.matches(set(words)):
+                    results.append((-query.score(words), -priority, top_id, pos, id))
+        results = heapq.nsmallest(limit, results) if limit is not None else sorted(results)
+        return [(result[-1], -result[0]) for result in results]
+
+    @classmethod
+    def read(self, filename, key):
+        try:
+            with open(filename, 'rb') as fp:
+                if marshal.load(fp) != key:
+                    return None
+                timings.count('search index read')
+                return self(*marshal.load(fp))
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def write(self, dump, key):
+        # dump is from TodoTxt._write_sidecar
+        trees = dict((id, tree if type(tree) is str else marshal.dumps(tree)) for id, tree in self.trees.iteritems())
+        words = dict((word, ids if type(ids) is str else array.array('l', ids).tostring()) for word, ids in self.words_index.iteritems())
+        dump(key)
+        dump((trees, words))
+
 
 class TMTodoTxt(TodoTxt):
     TASK_CLASS = TMTask
 
+    def __init__(self, *args, **kwargs):
+        super(TMTodoTxt, self).__init__(*args, **kwargs)
+        self.search_filename = self.filename + '.search'
+        self._search = None
+        # Top level IDs removed since loading, for the search index
+        self._search_removed = set()
+
+    def load(self):
+        self._index = None
+        self._search = None
+        self._search_removed = set()
+        super(TMTodoTxt, self).load()
+
+    def refresh(self):
+        self._search_removed = set()
+        changes = super(TMTodoTxt, self).refresh()
+        if changes:
+            self._index = None
+            self._search = None
+        return changes
+
+    def append(self, task):
+        self._index = None
+        super(TMTodoTxt, self).append(task)
+
+    def remove(self, task):
+        self._index = None
+        super(TMTodoTxt, self).remove(task)
+        self._search_removed.add(task.id)
+
+    def completed_tasks(self, subtasks=False):
+        moved = super(TMTodoTxt, self).completed_tasks()
+        if subtasks:
+            # Completed subtasks of unfinished tasks, each with its own subtasks
+            queue = [task for task in self.tasks if not task.completed]
+            while queue:
+                parent = queue.pop()
+                for task in parent.subtasks:
+                    if task.completed:
+                        moved.append((parent, task))
+                    else:
+                        queue.append(task)
+        return moved
+
+    def save(self):
+        # Tasks may have been changed in place, so the index could be out of date
+        self._index = None
+        with self.locked():
+            signature = self._loaded_signature if self._tasks is not None else self._partial_signature
+            changed = self._changed_trees()
+            super(TMTodoTxt, self).save()
+            self._search_removed = set()
+            if changed:
+                self._update_search_index(signature, changed)
+
+    def _changed_trees(self):
+        # Top level tasks to index again, by ID, with None for removed ones.  Only worked out if there's an index.
+        if self._search is None and not os.path.exists(self.search_filename):
+            return {}
+        if self._tasks is not None:
+            changed = dict((task.id, task) for task in self._tasks if task.line is None or task.is_dirty())
+        elif self._partial is not None:
+            changed = dict((id, task) for id, task in self._partial.items() if task.is_dirty())
+            changed.update((task.id, task) for task in self._partial_appended)
+        else:
+            return {}
+        for id in self._search_removed:
+            changed.setdefault(id, None)
+        return changed
+
+    @timings.timed('update search index')
+    def _update_search_index(self, signature, changed):
+        '''\
+        Index the changed tasks again, in the index in memory and the one next to the file.
+
+        The one next to the file is only updated if it was up to date before the save, otherwise it's left to be
+        built again by the next search.
+        '''
+        timings.count('tasks indexed', len(changed))
+        if self._search is not None:
+            for id, task in changed.items():
+                self._search.update(id, task)
+        if signature is None or not self.use_cache:
+            return
+        index = SearchIndex.read(self.search_filename, SearchIndex.key(signature))
+        if index is not None:
+            for id, task in changed.items():
+                index.update(id, task)
+            key = SearchIndex.key(self._loaded_signature if self._tasks is not None else self._partial_signature)
+            with self._write_sidecar(self.search_filename) as dump:
+                index.write(dump, key)
+
+    def search_index(self):
+        '''\
+        Return the SearchIndex of the tasks.
+
+        It's read from next to the file if it was written for the file as it is now, otherwise built from the tasks
+        and written out again.  Once loaded, the tasks are indexed as they are in memory instead, and the index is
+        kept up to date by save().
+        '''
+        if self._search is not None:
+            return self._search
+        index = None
+        signature = self._file_signature()
+        stored = self._tasks is None and self.use_cache and signature is not None
+        if stored:
+            index = SearchIndex.read(self.search_filename, SearchIndex.key(signature))
+        if index is None:
+            with timings.phase('build search index'):
+                index = SearchIndex()
+                for task in self.iter_tasks():
+                    index.update(task.id, task)
+            timings.count('tasks indexed', len(index.trees))
+            # The file may have changed while it was read
+            if stored and self._file_signature() == signature:
+                with self._write_sidecar(self.search_filename) as dump:
+                    index.write(dump, SearchIndex.key(signature))
+        if self._tasks is not None:
+            self._search = index
+        return index
+
+    @property
+    def index(self):
+        # The tasks are thrown away when changes are discarded, and the index with them
+        if self._tasks is None or getattr(self, '_index', None) is None:
+            self._index = TaskIndex(self._walk_task_list(self.tasks))
+        return self._index
+
     @classmethod
-    def _print_task_list(self, tasks, depth=0, parent_id=None):
+    def _walk_task_list(self, tasks, depth=0, parent_id=None):
         for task in tasks:
-            prefix = ''
-            if depth > 0:
-                prefix = ('  ' * depth) + str(parent_id) + '.'
-            print prefix + str(task.id), task._make_string(include_subtasks=False)
-            self._print_task_list(task.subtasks, depth=depth + 1, parent_id=(parent_id + '.' if parent_id else '') + str(task.id))
+            id = (parent_id + '.' if parent_id else '') + str(task.id)
+            yield id, depth, task
+            for entry in self._walk_task_list(task.subtasks, depth=depth + 1, parent_id=id):
+                yield entry
 
-    def print_tasks(self):
-        self._print_task_list(self.tasks)
+    @classmethod
+    def _print_task_list(self, tasks, depth=0, parent_id=None):
+        self._print_entries(self._walk_task_list(tasks, depth=depth, parent_id=parent_id))
+
+    @classmethod
+    def _print_entries(self, entries, indent=True):
+        for id, depth, task in entries:
+            print ('  ' * depth if indent else '') + id, task._make_string(include_subtasks=False)
+
+    def iter_entries(self):
+        for task in self.iter_tasks():
+            for entry in self._walk_task_list([task]):
+                yield entry
+
+    def select_entries(self, query=None, sort=None, limit=None):
+        if self._tasks is not None and (query is not None or sort is not None):
+            # The tasks are in memory anyway, so build the index to answer the query
+            return self.index.select(query, sort, limit)
+        # Otherwise stream the tasks, so each one can be used as soon as it's read
+        entries = self.iter_entries()
+        if sort is not None:
+            # Due dates are inherited from tasks the query might not match, so they're worked out before filtering
+            pairs = TaskSort.inherit_due(entries)
+            if query is not None:
+                pairs = ((entry, due) for entry, due in pairs if query.matches(entry[2]))
+            return sort.select(((sort.key(entry[2], due), entry) for entry, due in pairs), limit)
+        if query is not None:
+            entries = (entry for entry in entries if query.matches(entry[2]))
+        if limit is not None:
+            entries = itertools.islice(entries, limit)
+        return entries
+
+    def print_tasks(self, query=None, sort=None, limit=None):
+        # Sorted tasks aren't under their parents, so they aren't indented
+        self._print_entries(self.select_entries(query, sort, limit), indent=sort is None)
 
 
 class CommandError(Exception):
@@ -370,16 +2426,29 @@ class Command(object):
     The base for all other commands.
     '''
 
-    def __init__(self, prog, config):
+    # Read only commands stream tasks from the file instead of loading the whole list
+    READ_ONLY = False
+
+    # Commands that may change the task list hold the lock on the file while they run
+    LOCK_FILE = True
+
+    # Seconds to keep running a command on a fresh copy of the file while something else keeps changing it
+    CONFLICT_TIMEOUT = 30
+
+    # Whether --client may send the command to the daemon, which runs one command at a time in its own process
+    FORWARD = True
+
+    def __init__(self, prog, config, todotxt=None):
         names = self.command_names()
         if len(names) > 1:
             names = '{{{}}}'.format(','.join(names))
         else:
             names = names[0]
         self.parser = argparse.ArgumentParser(prog=prog + ' ' + names, description=self.command_doc(), formatter_class=argparse.RawDescriptionHelpFormatter)
-        self.add_parser_args()
+        self.prog = prog
         self.config = config
-        self.todotxt = TMTodoTxt(config['todo.txt'])
+        self.add_parser_args()
+        self.todotxt = todotxt if todotxt is not None else TMTodoTxt(config['todo.txt'])
 
     def add_parser_args(self):
         pass
@@ -397,28 +2466,75 @@ class Command(object):
         return self.command_doc().split('\n')[0]
 
     @classmethod
-    def subcommands(self, prog, config):
+    def subcommands(self):
         out = {}
         queue = [self]
         while queue:
             cls = queue.pop()
             if cls is not self:
                 names = list(filter(lambda v: not v.startswith('_'), cls.command_names()))
-                if names:
-                    instance = cls(prog, config)
-                    for name in names:
-                        out[name] = instance
+                for name in names:
+                    out[name] = cls
             queue += cls.__subclasses__()
         return out
 
     def __call__(self, args):
-        parsed_args = self.parser.parse_args(args)
+        with timings.phase('parse arguments'):
+            parsed_args = self.parser.parse_args(args)
         try:
-            return self.run(parsed_args) or 0
-        except CommandError as e:
+            with timings.phase('run'):
+                self.prepare(parsed_args)
+                if self.READ_ONLY or not self.LOCK_FILE:
+                    return self.run(parsed_args) or 0
+                return self.run_locked(parsed_args) or 0
+        except (CommandError, LockError, ConflictError) as e:
             sys.stderr.write(str(e) + '\n')
             return 1
 
+    def prepare(self, args):
+        # Runs once before run(), without the lock, and anything set on args is kept if run() is called again
+        pass
+
+    def run_locked(self, args):
+        '''\
+        Run while holding the lock on the file, so other copies of taskmaster wait rather than lose each other's changes.
+
+        Programs that don't take the lock can still change the file while the command runs, in which case saving
+        fails with ConflictError.  The changes are then made again to a fresh copy of the file, from the same
+        arguments, with only the output of the last attempt printed.  Only the lines that changed are parsed again,
+        and attempts are spaced out by a growing random delay, so a retry soon fits in between the other program's
+        writes.  ConflictError is only raised once the file has kept changing for CONFLICT_TIMEOUT seconds.
+        '''
+        todotxt = self.todotxt
+        deadline = time.time() + self.CONFLICT_TIMEOUT
+        with todotxt.locked():
+            for attempt in itertools.count():
+                if attempt:
+                    timings.count('conflict retries')
+                    import random
+                    time.sleep(random.uniform(0, min(0.01 * 2 ** attempt, 0.5)))
+                # Commands set their own values on args, so each attempt starts from a fresh copy
+                attempt_args = copy.copy(args)
+                if todotxt._tasks is not None:
+                    # Loaded before the lock was taken, such as by the daemon, so catch up with any changes since
+                    todotxt.refresh()
+                stdout = sys.stdout
+                sys.stdout = out = StringIO()
+                conflict = False
+                try:
+                    return self.run(attempt_args)
+                except ConflictError:
+                    conflict = True
+                    if time.time() >= deadline:
+                        raise
+                    if todotxt._tasks is None:
+                        # Tasks read by find() are read again, loaded tasks are refreshed at the start of the next attempt
+                        todotxt.tasks = None
+                finally:
+                    sys.stdout = stdout
+                    if not conflict:
+                        sys.stdout.write(out.getvalue())
+
     def run(self, args):
         raise NotImplementedError()
 
@@ -436,7 +2552,10 @@ class _SingleTaskCommand(_WrappedCommand):
 
     def run_wrapper(self, run):
         def wrapped(args):
-            task = self.todotxt.get(args.task_id)
+            if self.READ_ONLY:
+                task = self.todotxt.find(args.task_id)
+            else:
+                task = self.todotxt.get(args.task_id)
             if not task:
                 raise CommandError("No such task")
             args.task = task
@@ -444,6 +2563,108 @@ class _SingleTaskCommand(_WrappedCommand):
         return wrapped
 
 
+class _MultiTaskCommand(_WrappedCommand):
+    '''\
+    Run a command on several tasks, given by ID, by ranges of IDs, or by a filter.
+
+    run() is called once per task with args.task_id and args.task set, and raises CommandError to skip a task.  The
+    file is saved once at the end, and a summary is printed using SUMMARY.
+    '''
+
+    SUMMARY = "Changed {changed} of {total} tasks"
+
+    def add_parser_args(self):
+        self.parser.add_argument('task_ids', nargs='*', metavar='task_id', help="Task IDs (1, 2.4, etc) or ranges of IDs within one list (3-40, 7.1-7.9)")
+        self.parser.add_argument('--filter', nargs='+', metavar='TERM', help="Also select every task matching these filter terms, as for list")
+        self.parser.add_argument('-n', '--dry-run', action='store_true', help="Show what would change without saving it")
+        super(_MultiTaskCommand, self).add_parser_args()
+
+    def resolve_ids(self, spec):
+        if '-' not in spec:
+            # Without the cache find() streams the file, and the tasks it returns aren't the ones that get saved
+            task = self.todotxt.find(spec) if self.todotxt.use_cache else self.todotxt.get(spec)
+            if not task:
+                raise CommandError("No such task: " + spec)
+            return [(spec, task)]
+
+        start, end = spec.split('-', 1)
+        try:
+            start_ids = [int(v) for v in start.split('.')]
+            end_ids = [int(v) for v in end.split('.')]
+        except ValueError:
+            raise CommandError("Invalid task ID range: " + spec)
+        if len(start_ids) != len(end_ids) or start_ids[:-1] != end_ids[:-1] or start_ids[-1] > end_ids[-1]:
+            raise CommandError("Invalid task ID range: " + spec)
+        parent_id = '.'.join(map(str, start_ids[:-1]))
+        parent = self.todotxt.get(parent_id) if parent_id else self.todotxt
+        if not parent:
+            raise CommandError("No such task: " + parent_id)
+        prefix = parent_id + '.' if parent_id else ''
+        # IDs missing from the range, such as blank lines, are skipped
+        tasks = [(prefix + str(task.id), task) for task in parent._tasklist if start_ids[-1] <= task.id <= end_ids[-1]]
+        if not tasks:
+            raise CommandError("No such tasks: " + spec)
+        return tasks
+
+    def select_tasks(self, args):
+        if not args.task_ids and not args.filter:
+            self.parser.error("at least one task ID or --filter is required")
+        selected = []
+        for spec in args.task_ids:
+            selected.extend(self.resolve_ids(spec))
+        if args.filter:
+            try:
+                query = TaskQuery(args.filter)
+            except QueryError as e:
+                raise CommandError(str(e))
+            selected.extend((task_id, task) for task_id, _, task in self.todotxt.index.select(query))
+
+        # The same task may be selected more than once
+        seen = set()
+        tasks = []
+        for task_id, task in selected:
+            if task_id not in seen:
+                seen.add(task_id)
+                tasks.append((task_id, task))
+        return tasks
+
+    def run_wrapper(self, run):
+        def wrapped(args):
+            tasks = self.select_tasks(args)
+            args.changed = []
+            errors = []
+            for task_id, task in tasks:
+                args.task_id = task_id
+                args.task = task
+                try:
+                    run(args)
+                except CommandError as e:
+                    errors.append((task_id, str(e)))
+                else:
+                    args.changed.append((task_id, task))
+            changed = len(args.changed)
+
+            if len(tasks) == 1 and errors:
+                raise CommandError(errors[0][1])
+            for task_id, error in errors:
+                sys.stderr.write('{}: {}\n'.format(task_id, error))
+            summary = self.SUMMARY.format(changed=changed, total=len(tasks))
+            if args.dry_run:
+                print summary + ' (dry run, nothing saved)'
+                if changed:
+                    # Throw away the changes, in case the task list is kept in memory
+                    self.todotxt.tasks = None
+            else:
+                print summary
+                if changed:
+                    self.save(args)
+            return 1 if errors and not changed else 0
+        return wrapped
+
+    def save(self, args):
+        self.todotxt.save()
+
+
 def _EditingCommand(desc_as_flag=False, with_subtask=True):
     class _EditingCommandImpl(object):
         def add_parser_args(self):
@@ -467,12 +2688,20 @@ def _EditingCommand(desc_as_flag=False, with_subtask=True):
             self.parser.add_argument('--recur-until', help="Recur until (YYYY-MM-DD)", type=parse_date)
             super(_EditingCommandImpl, self).add_parser_args()
 
-        def apply_recur(self, args, task):
+        def check_recur(self, args, due):
             if args.recur:
-                if not task.due:
+                if not due:
                     raise CommandError("Recurrence requires a due date")
                 if args.recur_count and args.recur_until:
                     raise CommandError("Recurrence count and until date are mutually exclusive")
+            else:
+                for arg in ('recur_interval', 'recur_count', 'recur_until'):
+                    if getattr(args, arg, None):
+                        raise CommandError("--{} requires --recur and --due".format(arg.replace('_', '-')))
+
+        def apply_recur(self, args, task):
+            self.check_recur(args, task.due)
+            if args.recur:
                 rule = 'RRULE:FREQ=' + args.recur.upper()
                 if args.recur_interval:
                     rule += ';INTERVAL=' + str(args.recur_interval)
@@ -481,10 +2710,7 @@ def _EditingCommand(desc_as_flag=False, with_subtask=True):
                 elif args.recur_until:
                     rule += ';UNTIL=' + format_date(args.recur_until)
                 task.rrule = rrule.rrulestr(rule, dtstart=task.due, forceset=True)
-            else:
-                for arg in ('recur_interval', 'recur_count', 'recur_until'):
-                    if getattr(args, arg, None):
-                        raise CommandError("--{} requires --recur and --due".format(arg.replace('_', '-')))
+                timings.count('rrules built')
     return _EditingCommandImpl
 
 
@@ -492,11 +2718,343 @@ class ListCommand(Command):
     '''\
     List tasks.
 
-    Print a list of tasks.
+    Print a list of tasks, optionally only those matching a filter such as:
+
+      +project @context due<2026-11-01 pri>=B !done tag:key=value
+
+    With --sort, tasks and subtasks are listed together in the given order, such as --sort due,priority for the
+    soonest due first, and the highest priority first among those due the same day.  A subtask without a due date is
+    due when its parent is.
     '''
 
+    READ_ONLY = True
+
+    def add_parser_args(self):
+        self.parser.add_argument('-a', '--archived', action='store_true', help="List the archived tasks in the done file instead")
+        self.parser.add_argument('-s', '--sort', metavar='FIELDS', help="Sort by these comma separated fields: due, priority, created")
+        self.parser.add_argument('-l', '--limit', type=int, metavar='N', help="List only the first N tasks")
+        self.parser.add_argument('filter', nargs='*', help="Filter terms: +project, @context, tag:key[=value], due<DATE, pri>=B, done; prefix a term with ! to negate it")
+
+    def parse_list_args(self, args):
+        # The task list, query, and order to list
+        query = None
+        sort = None
+        try:
+            if args.filter:
+                query = TaskQuery(args.filter)
+            if args.sort:
+                sort = TaskSort(args.sort)
+        except QueryError as e:
+            raise CommandError(str(e))
+        if args.limit is not None and args.limit < 0:
+            raise CommandError("The limit can't be negative")
+        todotxt = self.todotxt
+        if args.archived:
+            todotxt = TMTodoTxt(self.config['done.txt'], use_cache=todotxt.use_cache)
+        return todotxt, query, sort
+
     def run(self, args):
-        self.todotxt.print_tasks()
+        todotxt, query, sort = self.parse_list_args(args)
+        todotxt.print_tasks(query, sort, args.limit)
+
+
+class WatchCommand(ListCommand):
+    '''\
+    Keep a list of tasks up to date.
+
+    List tasks as list does, with the same options, and list them again whenever the file changes, until
+    interrupted.  Only the lines that changed are parsed again.
+    '''
+
+    # Clears the terminal and moves the cursor to the top
+    CLEAR = '\x1b[H\x1b[2J'
+
+    # It never finishes, so it would keep the daemon from running anything else
+    FORWARD = False
+
+    def add_parser_args(self):
+        self.parser.add_argument('-i', '--interval', type=float, default=1, help="Seconds between checks for changes to the file, 1 by default")
+        super(WatchCommand, self).add_parser_args()
+
+    def run(self, args):
+        todotxt, query, sort = self.parse_list_args(args)
+        changes = todotxt.refresh()
+        try:
+            while True:
+                if sys.stdout.isatty():
+                    sys.stdout.write(self.CLEAR)
+                print '{}  {}  ({})'.format(todotxt.filename, time.strftime('%Y-%m-%d %H:%M:%S'), changes)
+                todotxt.print_tasks(query, sort, args.limit)
+                sys.stdout.flush()
+                while not todotxt.changed_on_disk():
+                    time.sleep(args.interval)
+                changes = todotxt.refresh()
+        except KeyboardInterrupt:
+            pass
+
+
+class ExportCommand(ListCommand):
+    '''\
+    Export tasks as JSON, newline delimited JSON, or CSV.
+
+    Write a record for each task and subtask with its dotted ID, completion, dates, priority, description, projects,
+    contexts, tags, due date, and recurrence rule, optionally only those matching a filter as for list.  Records are
+    written as the tasks are read, so the output is never held in memory whole.  In CSV, lists are separated by
+    spaces and tags written as key:value.
+    '''
+
+    FORMATS = ('json', 'ndjson', 'csv')
+
+    # Files are relative to, and standard input and output belong to, the process the command runs in
+    FORWARD = False
+
+    def add_parser_args(self):
+        self.parser.add_argument('-f', '--format', choices=self.FORMATS, default='json', help="Output format, json by default")
+        self.parser.add_argument('-o', '--output', metavar='FILE', help="Write to FILE instead of standard output")
+        super(ExportCommand, self).add_parser_args()
+
+    def run(self, args):
+        todotxt, query, sort = self.parse_list_args(args)
+        entries = todotxt.select_entries(query, sort, args.limit)
+        records = (task.export_record(id) for id, depth, task in entries)
+        fp = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            getattr(self, 'write_' + args.format)(fp, records)
+        finally:
+            if fp is not sys.stdout:
+                fp.close()
+
+    @classmethod
+    def write_json(self, fp, records):
+        import json
+        # Only the default encoding is done in C, so the keys aren't sorted
+        encode = json.dumps
+        # The list is written a record at a time rather than built whole for json.dump()
+        fp.write('[')
+        for i, record in enumerate(records):
+            fp.write((',\n' if i else '\n') + encode(record))
+        fp.write('\n]\n')
+
+    @classmethod
+    def write_ndjson(self, fp, records):
+        import json
+        encode = json.dumps
+        for record in records:
+            fp.write(encode(record) + '\n')
+
+    @classmethod
+    def write_csv(self, fp, records):
+        import csv
+        writer = csv.writer(fp)
+        writer.writerow(TMTask.EXPORT_FIELDS)
+        csv_value = self.csv_value
+        for record in records:
+            writer.writerow([csv_value(record[field]) for field in TMTask.EXPORT_FIELDS])
+
+    @classmethod
+    def csv_value(self, value):
+        if value is None:
+            return ''
+        elif isinstance(value, bool):
+            return 'true' if value else 'false'
+        elif isinstance(value, list):
+            return ' '.join(value)
+        elif isinstance(value, dict):
+            return ' '.join(k + ':' + v for k, v in sorted(value.items()))
+        return value
+
+
+class ImportCommand(Command):
+    '''\
+    Import tasks from JSON, newline delimited JSON, or CSV.
+
+    Add a task for each record, in the format written by export.  A record whose ID is a subtask of an earlier
+    record's ID is added as a subtask of that task, any other record is added after the existing tasks.  A record
+    without a created date gets today's, as for add.  The file is only saved once, after every record has been read.
+    '''
+
+    # Formats by file extension, when not given
+    EXTENSIONS = {
+        '.json': 'json',
+        '.ndjson': 'ndjson',
+        '.jsonl': 'ndjson',
+        '.csv': 'csv',
+    }
+
+    # Files are relative to, and standard input belongs to, the process the command runs in
+    FORWARD = False
+
+    def add_parser_args(self):
+        self.parser.add_argument('file', help="File to import, - for standard input")
+        self.parser.add_argument('-f', '--format', choices=ExportCommand.FORMATS, help="Input format, by default from the file's extension")
+
+    def prepare(self, args):
+        args.format = args.format or self.EXTENSIONS.get(os.path.splitext(args.file)[1].lower())
+        if not args.format:
+            raise CommandError("Can't tell the format of {}, use --format".format(args.file))
+        # Standard input can only be read once, and the import may have to be run again
+        args.data = sys.stdin.read() if args.file == '-' else None
+
+    def run(self, args):
+        try:
+            fp = StringIO(args.data) if args.data is not None else open(args.file, 'r')
+        except IOError as e:
+            raise CommandError("Can't read {}: {}".format(args.file, e.strerror))
+        # Imported tasks by their ID in the input, to find the parents of subtasks
+        imported = {}
+        count = 0
+        with contextlib.closing(fp):
+            for number, record in enumerate(getattr(self, 'read_' + args.format)(fp), 1):
+                if not isinstance(record, dict):
+                    raise CommandError("Record {}: not a record".format(number))
+                try:
+                    task = TMTask.import_record(record)
+                except (ValueError, TypeError) as e:
+                    raise CommandError("Record {}: {}".format(number, e))
+                record_id = str(record.get('id') or '')
+                parent = imported.get(record_id.rpartition('.')[0]) if '.' in record_id else None
+                (parent or self.todotxt).append(task)
+                if record_id:
+                    imported[record_id] = task
+                count += 1
+        if count:
+            self.todotxt.save()
+        print "Imported {} tasks".format(count)
+
+    @classmethod
+    def _from_json(self, record):
+        # json gives unicode strings, where tasks hold UTF-8.  Records are only one level deep, with lists of strings
+        # and the tags dict, so there's no need to walk them any deeper.
+        if type(record) is not dict:
+            return record
+        for key, value in record.items():
+            value_type = type(value)
+            if value_type is unicode:
+                record[key] = value.encode('utf-8')
+            elif value_type is list and value:
+                record[key] = [v.encode('utf-8') if type(v) is unicode else v for v in value]
+            elif value_type is dict and value:
+                record[key] = dict((k.encode('utf-8'), v.encode('utf-8') if type(v) is unicode else v) for k, v in value.iteritems())
+        return record
+
+    @classmethod
+    def read_json(self, fp):
+        import json
+        try:
+            records = json.load(fp)
+        except ValueError as e:
+            raise CommandError("Invalid JSON: " + str(e))
+        if not isinstance(records, list):
+            raise CommandError("Expected a list of records")
+        for record in records:
+            yield self._from_json(record)
+
+    @classmethod
+    def read_ndjson(self, fp):
+        import json
+        for number, line in enumerate(fp, 1):
+            if line.strip():
+                try:
+                    yield self._from_json(json.loads(line))
+                except ValueError as e:
+                    raise CommandError("Invalid JSON on line {}: {}".format(number, e))
+
+    @classmethod
+    def read_csv(self, fp):
+        import csv
+        for row in csv.DictReader(fp):
+            record = dict((k, v or None) for k, v in row.items())
+            record['completed'] = (record.get('completed') or '').lower() in ('1', 'x', 'yes', 'true')
+            for field in ('projects', 'contexts'):
+                record[field] = (record.get(field) or '').split()
+            record['tags'] = dict(tag.split(':', 1) for tag in (record.get('tags') or '').split() if ':' in tag)
+            yield record
+
+
+class TopCommand(Command):
+    '''\
+    Show the next tasks to do.
+
+    List the unfinished tasks and subtasks due soonest, then with the highest priority, optionally only those matching
+    a filter as for list.  The same as list --sort due,priority --limit N !done.
+    '''
+
+    READ_ONLY = True
+
+    def add_parser_args(self):
+        self.parser.add_argument('-n', '--limit', type=int, default=10, metavar='N', help="Number of tasks to list, 10 by default")
+        self.parser.add_argument('filter', nargs='*', help="Filter terms, as for list")
+
+    def run(self, args):
+        if args.limit < 0:
+            raise CommandError("The limit can't be negative")
+        try:
+            query = TaskQuery(['!done'] + args.filter)
+        except QueryError as e:
+            raise CommandError(str(e))
+        self.todotxt.print_tasks(query, TaskSort('due,priority'), args.limit)
+
+
+class SearchCommand(Command):
+    '''\
+    Search task descriptions.
+
+    List the tasks and subtasks whose descriptions have all the given words, those with the most matching words first,
+    then the highest priority.  Join words with OR to match either one, and end a word with * to match any word
+    starting with it, such as:
+
+      invoice OR receipt draft*
+
+    Case and punctuation are ignored.  Projects, contexts, tags, and dates aren't searched, list filters on those.
+    The index of the words is kept next to the todo.txt file (todo.txt.search) and updated as tasks are changed.
+    '''
+
+    READ_ONLY = True
+
+    def add_parser_args(self):
+        self.parser.add_argument('-a', '--all', action='store_true', help="Include completed tasks")
+        self.parser.add_argument('-l', '--limit', type=int, metavar='N', help="List only the first N tasks")
+        self.parser.add_argument('words', nargs='+', metavar='word', help="Words to search for, OR, or a prefix ending in *")
+
+    def run(self, args):
+        if args.limit is not None and args.limit < 0:
+            raise CommandError("The limit can't be negative")
+        try:
+            query = SearchQuery(args.words)
+        except QueryError as e:
+            raise CommandError(str(e))
+        index = self.todotxt.search_index()
+        results = index.search(query, completed=args.all, limit=args.limit)
+        # Parsing a task's line on its own costs a few times what reading it from the cache does, and without the
+        # cache find() parses the file up to each task, so for many results the whole list is loaded once instead
+        found = set(id.split('.', 1)[0] for id, score in results)
+        if self.todotxt.use_cache and len(found) * 4 < len(index.trees):
+            find = self.todotxt.find
+        else:
+            find = self.todotxt.get
+        for id, score in results:
+            task = find(id)
+            # Only if the file was changed without its size or modification time showing it
+            if task is None or not query.matches(set(SearchIndex.words(task.description))):
+                continue
+            print id, task._make_string(include_subtasks=False)
+
+
+class ArchiveCommand(Command):
+    '''\
+    Archive completed tasks.
+
+    Move completed tasks to the end of the done file (the done.txt config option, done.txt next to todo.txt by
+    default).  Each leaves a blank line behind, so the remaining tasks keep their IDs.  Use list --archived to see
+    them.
+    '''
+
+    def add_parser_args(self):
+        self.parser.add_argument('-s', '--subtasks', action='store_true', help="Also archive completed subtasks of unfinished tasks.  Later subtasks of the same task are renumbered.")
+
+    def run(self, args):
+        moved = self.todotxt.archive(self.config['done.txt'], subtasks=args.subtasks)
+        print "Archived {} tasks to {}".format(len(moved), self.config['done.txt'])
 
 
 class ShowCommand(_SingleTaskCommand, Command):
@@ -506,6 +3064,8 @@ class ShowCommand(_SingleTaskCommand, Command):
     Show a single task.
     '''
 
+    READ_ONLY = True
+
     @classmethod
     def command_names(self):
         return ['show', 's']
@@ -514,43 +3074,101 @@ class ShowCommand(_SingleTaskCommand, Command):
         print args.task.id, args.task._make_string(include_subtasks=False)
 
 
-class NextCommand(_SingleTaskCommand, Command):
+class AgendaCommand(Command):
+    '''\
+    Show upcoming tasks.
+
+    List every due date and recurrence of the incomplete tasks between two dates, in date order, optionally only for
+    the tasks matching a filter as for list.
+    '''
+
+    READ_ONLY = True
+
+    def add_parser_args(self):
+        self.parser.add_argument('--from', dest='start', type=parse_date, help="First day to show (YYYY-MM-DD), today by default")
+        self.parser.add_argument('--to', dest='end', type=parse_date, help="Last day to show (YYYY-MM-DD), a week after the first by default")
+        self.parser.add_argument('filter', nargs='*', help="Filter terms, as for list")
+
+    def run(self, args):
+        query = None
+        if args.filter:
+            try:
+                query = TaskQuery(args.filter)
+            except QueryError as e:
+                raise CommandError(str(e))
+        start = args.start or parse_date(utcnow())
+        end = (args.end or start.add(days=7)).add(days=1)
+        if end <= start:
+            raise CommandError("The agenda ends before it starts")
+
+        # Each task's dates are already in order, so merging them keeps only one date per task in memory at a time
+        streams = []
+        for id, depth, task in self.todotxt.select_entries(query):
+            if not task.completed and task.due is not None:
+                streams.append(self._occurrences(len(streams), id, task, start, end))
+        for _, _, date, id, task in heapq.merge(*streams):
+            print date.strftime('%Y-%m-%d'), id, task._make_string(include_subtasks=False)
+
+    @classmethod
+    def _occurrences(self, order, id, task, start, end):
+        # Ordered by day, then by position in the list, which is cheaper than comparing the dates themselves
+        for date in task.occurrences(start, end):
+            yield date.toordinal(), order, date, id, task
+
+
+class NextCommand(_MultiTaskCommand, Command):
     '''\
-    Add the next instance of a recurring task.
+    Add the next instance of recurring tasks.
 
-    Clone the given task, and add it to the task list (uncompleted) with its due date set to the next recurring date.
+    Clone each given task, and add it to the task list (uncompleted) with its due date set to the next recurring date.
     '''
 
+    SUMMARY = "Added the next instance of {changed} of {total} tasks"
+
     def run(self, args):
         new_task = args.task.next()
         if not new_task:
             raise CommandError("The task does not recur")
         self.todotxt.append(new_task)
-        self.todotxt.print_tasks()
-        self.todotxt.save()
+        self.todotxt._print_task_list([new_task])
 
 
-class CompleteCommand(_SingleTaskCommand, Command):
+class CompleteCommand(_MultiTaskCommand, Command):
     '''\
-    Complete a task.
+    Complete tasks.
 
-    Mark a task as completed, adding the next instance of the task if it is a recurring task.
+    Mark tasks as completed, adding the next instance of each recurring task.
     '''
 
+    SUMMARY = "Completed {changed} of {total} tasks"
+
     @classmethod
     def command_names(self):
         return ['complete', 'c', 'x']
 
+    def add_parser_args(self):
+        self.parser.add_argument('-a', '--archive', action='store_true', default=self.config.get_bool('archive-on-complete'), help="Move the completed top level tasks to the done file, as archive does (the default if archive-on-complete is set)")
+        self.parser.add_argument('--no-archive', dest='archive', action='store_false', help="Don't archive, even if archive-on-complete is set")
+        super(CompleteCommand, self).add_parser_args()
+
+    def save(self, args):
+        # Only the top level tasks completed just now are archived, as archive would
+        moved = [(self.todotxt, task) for task_id, task in args.changed if '.' not in task_id] if args.archive else None
+        if moved:
+            self.todotxt.archive(self.config['done.txt'], moved)
+        else:
+            super(CompleteCommand, self).save(args)
+
     def run(self, args):
         if args.task.completed:
             raise CommandError("The task is already completed")
         args.task.completed = True
         args.task.completed_at = pendulum.utcnow()
+        print args.task_id, args.task._make_string(include_subtasks=False)
         new_task = args.task.next()
         if new_task:
             self.todotxt.append(new_task)
-        self.todotxt.print_tasks()
-        self.todotxt.save()
+            self.todotxt._print_task_list([new_task])
 
 
 class AddCommand(_EditingCommand(), Command):
@@ -584,47 +3202,211 @@ class AddCommand(_EditingCommand(), Command):
         self.todotxt.print_tasks()
         self.todotxt.save()
 
-class EditCommand(_SingleTaskCommand, _EditingCommand(desc_as_flag=True, with_subtask=False), Command):
+class EditCommand(_MultiTaskCommand, _EditingCommand(desc_as_flag=True, with_subtask=False), Command):
     '''\
-    Edit a task.
+    Edit tasks.
+
+    Apply the same changes to each given task.
     '''
 
+    SUMMARY = "Edited {changed} of {total} tasks"
+
     @classmethod
     def command_names(self):
         return ['edit', 'e']
 
     def run(self, args):
+        # Check first so a task that can't be edited is left as it was
+        self.check_recur(args, args.due or args.task.due)
         args.task.description = args.description or args.task.description
         args.task.completed = args.complete or args.task.completed
         args.task.priority = args.priority or args.task.priority
         args.task.created_at = args.created or args.task.created_at
         args.task.completed_at = args.completed or args.task.completed_at
 
+        # Lists and tags are replaced rather than changed in place so the task is marked as changed
         # TODO: remove projects
         if args.project:
-            for project in args.project:
-                args.task.projects.append(project)
+            args.task.projects = list(args.task.projects) + args.project
         # TODO: remove contexts
         if args.context:
-            for context in args.context:
-                args.task.contexts.append(context)
+            args.task.contexts = list(args.task.contexts) + args.context
         # TODO: remove tags
         if args.tag:
-            for key, value in args.tag:
-                args.task.tags[key] = value
+            tags = dict(args.task.tags)
+            tags.update(args.tag)
+            args.task.tags = tags
 
         if args.due:
             args.task.due = args.due
 
-        self.apply_recur(args, task)
+        self.apply_recur(args, args.task)
 
-        print args.task._make_string(include_subtasks=False)
-        self.todotxt.save()
+        print args.task_id, args.task._make_string(include_subtasks=False)
+
+
+class ServeCommand(Command):
+    '''\
+    Run as a daemon.
+
+    Keep the task list loaded and run the commands sent to it with --client over a Unix socket.  The file is reloaded
+    whenever it changes on disk, and commands run one at a time.
+    '''
+
+    # Each command the daemon runs takes the lock itself
+    LOCK_FILE = False
+    FORWARD = False
+
+    def add_parser_args(self):
+        self.parser.add_argument('--socket', help="Socket to listen on, by default the socket config option")
+
+    def run(self, args):
+        # A client going away shouldn't take the daemon with it
+        signal.signal(signal.SIGPIPE, signal.SIG_IGN)
+        # Remove the socket on the way out when stopped with kill
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        commands = dict((name, cls) for name, cls in Command.subcommands().items() if cls.FORWARD)
+        server = _TaskServer()(os.path.expanduser(args.socket or self.config['socket']), self.prog, self.config, self.todotxt, commands)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def _TaskServer():
+    # Only the daemon needs these, so they're imported when it starts
+    import json
+    import socket
+    import SocketServer
+    import threading
+
+    class TaskServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, socket_path, prog, config, todotxt, commands):
+            self.prog = prog
+            self.config = config
+            self.todotxt = todotxt
+            self.commands = commands
+            self._command_instances = {}
+            self.lock = threading.Lock()
+            if os.path.exists(socket_path):
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    probe.connect(socket_path)
+                except socket.error:
+                    # Left behind by a daemon that didn't shut down cleanly
+                    os.unlink(socket_path)
+                else:
+                    raise CommandError("Already running on " + socket_path)
+                finally:
+                    probe.close()
+            old_umask = os.umask(0o077)
+            try:
+                SocketServer.UnixStreamServer.__init__(self, socket_path, TaskRequestHandler)
+            finally:
+                os.umask(old_umask)
+
+        def server_close(self):
+            SocketServer.UnixStreamServer.server_close(self)
+            try:
+                os.unlink(self.server_address)
+            except OSError:
+                pass
+
+        def run_command(self, argv):
+            '''\
+            Run a command as if from the command line, returning the exit status and its output.
+            '''
+            with self.lock:
+                todotxt = self.todotxt
+                # Only the lines changed by other programs are parsed again
+                todotxt.refresh()
+                stdout, stderr = sys.stdout, sys.stderr
+                sys.stdout, sys.stderr = out, err = StringIO(), StringIO()
+                try:
+                    status = self._run_command(argv)
+                finally:
+                    sys.stdout, sys.stderr = stdout, stderr
+                if status:
+                    # Don't keep changes from a command that failed part way through
+                    todotxt.tasks = None
+                return status, out.getvalue(), err.getvalue()
+
+        def _run_command(self, argv):
+            try:
+                if not argv or argv[0] not in self.commands:
+                    raise CommandError("Unknown command: " + (argv[0] if argv else ''))
+                cls = self.commands[argv[0]]
+                command = self._command_instances.get(cls)
+                if command is None:
+                    command = self._command_instances[cls] = cls(self.prog, self.config, self.todotxt)
+                return command(argv[1:])
+            except SystemExit as e:
+                # From argparse, for --help or bad arguments
+                if e.code is None or isinstance(e.code, int):
+                    return e.code or 0
+                sys.stderr.write(str(e.code) + '\n')
+                return 1
+            except CommandError as e:
+                sys.stderr.write(str(e) + '\n')
+                return 1
+            except Exception:
+                traceback.print_exc()
+                return 1
+
+    class TaskRequestHandler(SocketServer.StreamRequestHandler):
+        # A request is a line of JSON with the arguments, the response a line of JSON with the status and output
+        def handle(self):
+            try:
+                argv = [arg.encode('utf-8') for arg in json.loads(self.rfile.readline())['argv']]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return
+            status, out, err = self.server.run_command(argv)
+            self.wfile.write(json.dumps({'status': status, 'stdout': out, 'stderr': err}) + '\n')
+
+    return TaskServer
+
+
+def forward_command(socket_path, argv):
+    '''\
+    Run a command in the daemon listening on socket_path and print its output.
+
+    Returns the command's exit status, or None if no daemon is listening.
+    '''
+    import json
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(os.path.expanduser(socket_path))
+        except socket.error:
+            return None
+        fp = sock.makefile('rwb')
+        fp.write(json.dumps({'argv': argv}) + '\n')
+        fp.flush()
+        line = fp.readline()
+    finally:
+        sock.close()
+    if not line:
+        # The command may or may not have run, so it's not safe to run it again here
+        sys.stderr.write("No response from the daemon\n")
+        return 1
+    response = json.loads(line)
+    sys.stdout.write(response['stdout'].encode('utf-8'))
+    sys.stderr.write(response['stderr'].encode('utf-8'))
+    return response['status']
 
 
 def main():
-    config = Config()
-    commands = Command.subcommands(sys.argv[0], config)
+    # Output is streamed, so exit quietly if whatever it's piped to stops reading
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    with timings.phase('config'):
+        config = Config()
+    with timings.phase('subcommands'):
+        commands = Command.subcommands()
 
     command_name_groups = {}
     for name, c in commands.items():
@@ -632,10 +3414,40 @@ def main():
     command_list = '\n'.join(['{} - {}'.format(', '.join(names), c.command_doc_oneline()) for c, names in command_name_groups.items()])
 
     parser = argparse.ArgumentParser(description="Manage a task list", epilog="Available commands:\n" + command_list, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--no-cache', action='store_true', help="Don't read or write the parsed task cache")
+    parser.add_argument('--timings', action='store_true', help="Print how long each phase took and some counts to standard error")
+    parser.add_argument('--profile', metavar='FILE', help="Write cProfile statistics for the command to FILE")
+    parser.add_argument('--client', action='store_true', help="Send the command to a running daemon (see serve), running it here if there isn't one")
     parser.add_argument('command', nargs='?', help="Command to run", default='list', choices=commands.keys())
     parser.add_argument('command_args', nargs=argparse.REMAINDER, help="Arguments for the command")
     args = parser.parse_args()
-    return commands[args.command](args.command_args)
+    timings.enabled = args.timings
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        if args.client and commands[args.command].FORWARD:
+            status = forward_command(config['socket'], [args.command] + args.command_args)
+            if status is not None:
+                return status
+        with timings.phase('setup'):
+            todotxt = TMTodoTxt(
+                config['todo.txt'],
+                use_cache=not args.no_cache,
+                parallel_threshold=config.get_int('parallel-threshold'),
+                workers=config.get_int('parallel-workers'),
+                lock_timeout=config.get_int('lock-timeout'),
+            )
+            command = commands[args.command](sys.argv[0], config, todotxt)
+        return command(args.command_args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.timings:
+            timings.report(sys.stderr)
 
 
 if __name__ == '__main__':